@@ -0,0 +1,107 @@
+import json
+import time
+
+import click
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, ArrayValue, KeyValue, KeyValueList
+
+from otel_demo.exporter.attributes import decode_attributes
+
+from .payloads import kv, resource, synthetic_trace_request
+
+
+def extract_anyvalue(value: AnyValue):
+    # the decoder before exporter.attributes
+    stupid_wrapper_helper = value.WhichOneof("value")
+    if stupid_wrapper_helper:
+        return getattr(value, stupid_wrapper_helper)
+    else:
+        return None
+
+
+def normalize_attributes(attributes) -> dict:
+    dct_attr = {}
+    for a in attributes:
+        dct_attr[a.key] = extract_anyvalue(a.value)
+    return dct_attr
+
+
+def strings(*values: str) -> AnyValue:
+    return AnyValue(array_value=ArrayValue(values=[AnyValue(string_value=value) for value in values]))
+
+
+def http_server_attributes() -> list[KeyValue]:
+    return [
+        kv("http.request.method", "POST"),
+        kv("url.scheme", "http"),
+        kv("url.path", "/recieve/bulk"),
+        kv("server.address", "localhost"),
+        kv("server.port", 8000),
+        kv("network.protocol.version", "1.1"),
+        kv("client.address", "127.0.0.1"),
+        kv("user_agent.original", "python-httpx/0.27.2"),
+        kv("http.response.status_code", 200),
+        kv("http.server.duration", 0.0123),
+    ]
+
+
+def nested_attributes() -> list[KeyValue]:
+    return [
+        *http_server_attributes(),
+        KeyValue(key="http.request.header.accept", value=strings("application/xml", "text/plain")),
+        KeyValue(key="messaging.message.body.size", value=AnyValue(int_value=512)),
+        KeyValue(key="messaging.message.id", value=AnyValue(bytes_value=b"\x8f\x12" * 8)),
+        KeyValue(
+            key="work",
+            value=AnyValue(
+                kvlist_value=KeyValueList(
+                    values=[kv("work_id", "work-42"), kv("repeat", 2), kv("delay", 0.5), kv("retry", False)]
+                )
+            ),
+        ),
+    ]
+
+
+def attribute_sets(spans: int) -> dict[str, list]:
+    request = synthetic_trace_request(1, spans, 2)
+    span_sets = [span.attributes for span in request.resource_spans[0].scope_spans[0].spans]
+    return {
+        "span": span_sets,
+        "event": [event.attributes for span in request.resource_spans[0].scope_spans[0].spans for event in span.events],
+        "resource": [resource(index).attributes for index in range(spans)],
+        "http server": [http_server_attributes() for _ in range(spans)],
+        "nested": [nested_attributes() for _ in range(spans)],
+    }
+
+
+def measure(fn, sets: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for attributes in sets:
+            fn(attributes)
+    return (time.perf_counter() - started) / (repeat * len(sets))
+
+
+def json_safe(fn, sets: list) -> bool:
+    try:
+        json.dumps([fn(attributes) for attributes in sets], allow_nan=False)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+@click.command(help="Compare normalize_attributes with the exporter's attribute decoder on realistic attribute sets")
+@click.option("-r", "--repeat", type=int, default=200, help="Passes over every attribute set")
+@click.option("-s", "--sets", "spans", type=int, default=512, help="Attribute sets of each kind")
+def main(repeat: int, spans: int):
+    for name, sets in attribute_sets(spans).items():
+        before = measure(normalize_attributes, sets, repeat)
+        after = measure(decode_attributes, sets, repeat)
+        note = "" if json_safe(normalize_attributes, sets) else " (normalize_attributes output is not JSON-safe)"
+        print(
+            f"{name:>12}: normalize_attributes {before * 1e6:.2f} us/set, "
+            f"decode_attributes {after * 1e6:.2f} us/set, {before / after:.2f}x{note}"
+        )
+
+
+if __name__ == "__main__":
+    main()
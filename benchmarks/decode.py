@@ -0,0 +1,41 @@
+import asyncio
+import os
+import time
+
+import click
+
+from otel_demo.exporter.decode_pool import DecodePool
+
+from .payloads import synthetic_trace_request
+
+
+async def measure(workers: int, payloads: list[bytes], spans: int) -> float:
+    with DecodePool(workers) as pool:
+        # spawn the workers before the clock starts
+        await asyncio.gather(*(pool.traces(payloads[0]) for _ in range(max(workers, 1))))
+        started = time.perf_counter()
+        await asyncio.gather(*(pool.traces(data) for data in payloads))
+        elapsed = time.perf_counter() - started
+    return spans * len(payloads) / elapsed
+
+
+async def run(max_workers: int, requests: int, spans: int, events: int):
+    payloads = [synthetic_trace_request(4, spans // 4, events).SerializeToString() for _ in range(requests)]
+    inline = await measure(0, payloads, spans)
+    print(f"inline: {inline:,.0f} spans/s")
+    for workers in range(1, max_workers + 1):
+        rate = await measure(workers, payloads, spans)
+        print(f"{workers:>6}: {rate:,.0f} spans/s ({rate / inline:.2f}x inline)")
+
+
+@click.command(help="Measure span decoding throughput of the exporter decode pool from 1 to N worker processes")
+@click.option("-w", "--workers", "max_workers", type=int, default=os.cpu_count() or 1, help="Max worker processes")
+@click.option("-r", "--requests", "requests", type=int, default=200, help="Serialized export requests to decode")
+@click.option("-s", "--spans", "spans", type=int, default=512, help="Spans per request")
+@click.option("-e", "--events", "events", type=int, default=2, help="Events per span")
+def main(max_workers: int, requests: int, spans: int, events: int):
+    asyncio.run(run(max_workers, requests, spans, events))
+
+
+if __name__ == "__main__":
+    main()
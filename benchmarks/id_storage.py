@@ -0,0 +1,84 @@
+import asyncio
+import random
+import time
+
+import click
+from sqlalchemy import text
+
+from otel_demo.exporter import db_setup
+from otel_demo.exporter.decode import decode_traces
+from otel_demo.exporter.ingest import BulkWriter
+from otel_demo.exporter.query import load_trace
+from otel_demo.exporter.settings import get_exporter_settings
+from otel_demo.exporter.tables import schema_metadata
+
+from .payloads import synthetic_trace_request
+
+SIZES = text(
+    "SELECT relname, pg_relation_size(relid), pg_indexes_size(relid) FROM pg_statio_user_tables "
+    "WHERE relname IN ('span', 'event') ORDER BY relname"
+)
+# flushes this backend's pending table statistics when the statement's transaction ends
+FLUSH_STATS = text("SELECT pg_stat_force_next_flush(), pg_stat_clear_snapshot()")
+# blocks read from shared buffers (hit) or from outside them (read) by all scans of the tables so far
+BLOCKS = text(
+    "SELECT sum(heap_blks_hit + coalesce(idx_blks_hit, 0)), sum(heap_blks_read + coalesce(idx_blks_read, 0)) "
+    "FROM pg_statio_user_tables WHERE relname IN ('span', 'event')"
+)
+
+
+def megabytes(size: int) -> str:
+    return f"{size / 1024**2:,.1f} MB"
+
+
+async def run(requests: int, spans: int, events: int, lookups: int):
+    settings = get_exporter_settings()
+    ids = "bytea" if settings.binary_ids else "hex text"
+    async with db_setup(settings) as engine:
+        writer = BulkWriter(engine, metadata=schema_metadata(settings.partitioned, settings.binary_ids))
+        trace_ids = set()
+        started = time.perf_counter()
+        for _ in range(requests):
+            batch = decode_traces(synthetic_trace_request(4, spans // 4, events), settings.binary_ids)
+            trace_ids.update(row[0] for row in batch["span"])
+            await writer.write(batch)
+        elapsed = time.perf_counter() - started
+        print(f"{ids} ids: wrote {requests * spans:,} spans in {elapsed:.1f}s")
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE span, event"))
+            for table, heap, indexes in await conn.execute(SIZES):
+                print(f"{table:>6}: table {megabytes(heap)}, indexes {megabytes(indexes)}")
+
+            sample = random.sample(sorted(trace_ids), min(lookups, len(trace_ids)))
+            hex_ids = [trace_id.hex() if isinstance(trace_id, bytes) else trace_id for trace_id in sample]
+            await conn.execute(FLUSH_STATS)
+            hit_before, read_before = (await conn.execute(BLOCKS)).one()
+            started = time.perf_counter()
+            for trace_id in hex_ids:
+                await load_trace(conn, trace_id)
+            elapsed = time.perf_counter() - started
+            await conn.execute(FLUSH_STATS)
+            hit_after, read_after = (await conn.execute(BLOCKS)).one()
+        hit, read = hit_after - hit_before, read_after - read_before
+        print(
+            f"{len(hex_ids)} trace lookups: {elapsed / len(hex_ids) * 1000:.2f} ms each, "
+            f"{(hit + read) / len(hex_ids):.1f} blocks each, cache hit rate {hit / max(hit + read, 1):.2%}"
+        )
+
+
+@click.command(
+    help="Write synthetic traces with the configured id schema (APP_BINARY_IDS) and report table and index sizes "
+    "and trace lookups. Run it once per mode, each against a fresh database"
+)
+@click.option("-r", "--requests", "requests", type=int, default=200, help="Export requests to write")
+@click.option("-s", "--spans", "spans", type=int, default=512, help="Spans per request")
+@click.option("-e", "--events", "events", type=int, default=2, help="Events per span")
+@click.option("-l", "--lookups", "lookups", type=int, default=500, help="Traces loaded through the query API code")
+def main(requests: int, spans: int, events: int, lookups: int):
+    asyncio.run(run(requests, spans, events, lookups))
+
+
+if __name__ == "__main__":
+    main()
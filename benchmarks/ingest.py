@@ -0,0 +1,80 @@
+import asyncio
+import time
+from functools import partial
+from typing import Awaitable, Callable
+
+import click
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from otel_demo.exporter import db_setup
+from otel_demo.exporter.decode import COLUMNS, decode_traces, nanos_to_datetime
+from otel_demo.exporter.ingest import BulkWriter
+from otel_demo.exporter.settings import ExporterSettings, WriteMode, get_exporter_settings
+from otel_demo.exporter.tables import Event, Span, schema_metadata
+
+from .payloads import synthetic_trace_request
+
+ORM_MODE = "orm"
+
+
+async def orm_write(sessionmaker: async_sessionmaker, request: ExportTraceServiceRequest):
+    # the pre-bulk write path: one ORM object per row, flushed by the unit of work
+    batch = decode_traces(request)
+    span_objs = []
+    for row in batch["span"]:
+        span = Span(**dict(zip(COLUMNS["span"], row)))
+        span.start_time, span.end_time = nanos_to_datetime(row[3]), nanos_to_datetime(row[4])
+        span_objs.append(span)
+    event_objs = []
+    for row in batch["event"]:
+        event = Event(**dict(zip(COLUMNS["event"], row)))
+        event.time = nanos_to_datetime(row[3])
+        event_objs.append(event)
+    async with sessionmaker() as session:
+        session: AsyncSession
+        session.add_all(span_objs)
+        session.add_all(event_objs)
+        await session.commit()
+
+
+def writer_factory(
+    mode: str, engine: AsyncEngine, settings: ExporterSettings
+) -> Callable[[ExportTraceServiceRequest], Awaitable[None]]:
+    if mode == ORM_MODE:
+        # the ORM models are the hex id schema
+        return partial(orm_write, async_sessionmaker(engine, class_=AsyncSession))
+    writer = BulkWriter(engine, WriteMode(mode), metadata=schema_metadata(settings.partitioned, settings.binary_ids))
+
+    async def bulk_write(request: ExportTraceServiceRequest):
+        await writer.write(decode_traces(request, settings.binary_ids))
+
+    return bulk_write
+
+
+async def run(modes: list[str], requests: int, spans: int, events: int):
+    settings = get_exporter_settings()
+    payloads = {mode: [synthetic_trace_request(4, spans // 4, events) for _ in range(requests)] for mode in modes}
+    rows_per_request = spans + spans * events
+    async with db_setup(settings) as engine:
+        for mode in modes:
+            write = writer_factory(mode, engine, settings)
+            started = time.perf_counter()
+            for request in payloads[mode]:
+                await write(request)
+            elapsed = time.perf_counter() - started
+            total = rows_per_request * requests
+            print(f"{mode:>7}: {total} rows in {elapsed:.2f}s -> {total / elapsed:,.0f} rows/s")
+
+
+@click.command(help="Compare exporter write paths on synthetic ExportTraceServiceRequest payloads")
+@click.option("-m", "--mode", "modes", multiple=True, default=[ORM_MODE, WriteMode.INSERT, WriteMode.COPY])
+@click.option("-r", "--requests", "requests", type=int, default=50, help="Export requests per mode")
+@click.option("-s", "--spans", "spans", type=int, default=512, help="Spans per request")
+@click.option("-e", "--events", "events", type=int, default=2, help="Events per span")
+def main(modes: list[str], requests: int, spans: int, events: int):
+    asyncio.run(run(list(modes), requests, spans, events))
+
+
+if __name__ == "__main__":
+    main()
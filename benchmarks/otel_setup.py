@@ -0,0 +1,32 @@
+import threading
+import time
+
+import click
+
+from otel_demo.utils.base import ProviderRegistry, get_otel_settings
+
+
+def measure(instances: int, shared: bool) -> tuple[float, int]:
+    threads = threading.active_count()
+    registry = ProviderRegistry()
+    started = time.perf_counter()
+    for index in range(instances):
+        settings = get_otel_settings({"client_name": f"a:{index}", "used_queue": "a", "instance": str(index)})
+        # a registry per instance builds its own exporters and processors, like every call did before
+        (registry if shared else ProviderRegistry()).get(settings)
+    elapsed = time.perf_counter() - started
+    return elapsed, threading.active_count() - threads
+
+
+@click.command(help="Time provider setup for several app instances in one process")
+@click.option("-n", "--instances", type=int, default=4, help="App instances with distinct resources")
+def main(instances: int):
+    # first exporter creation pays for lazy imports and grpc initialization
+    measure(1, True)
+    for name, shared in (("per instance", False), ("shared", True)):
+        elapsed, threads = measure(instances, shared)
+        print(f"{name:>12}: {elapsed * 1000:.1f} ms, {threads} background threads")
+
+
+if __name__ == "__main__":
+    main()
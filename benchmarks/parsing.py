@@ -0,0 +1,59 @@
+import time
+
+import click
+from lxml import etree
+from lxml.builder import E
+from lxml.etree import tostring
+
+from otel_demo.apps.models import Work
+from otel_demo.apps.parsing import parse_works
+from otel_demo.apps.producer import work_element
+
+
+def find_translate(data_parsed: etree._Element) -> Work:
+    # the pre-parser path: one find() per field on a fully built tree
+    return Work(
+        work_id=data_parsed.find("workid").text,  # type: ignore
+        cid=data_parsed.find("cid").text,  # type: ignore
+        repeat=int(data_parsed.find("repeat").text),  # type: ignore
+        delay=float(data_parsed.find("delay").text),  # type: ignore
+        no_val1=int(data_parsed.find("no_val1").text),  # type: ignore
+        no_val2=int(data_parsed.find("no_val2").text),  # type: ignore
+        str_val1=data_parsed.find("str_val1").text,  # type: ignore
+        str_val2=data_parsed.find("str_val2").text,  # type: ignore
+    )
+
+
+def find_parse(body: bytes) -> Work:
+    return find_translate(etree.fromstring(body))
+
+
+def find_parse_bulk(body: bytes) -> list[Work]:
+    return [find_translate(work_el) for work_el in etree.fromstring(body).iterchildren("work")]
+
+
+def measure(fn, body: bytes, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - started) / repeat
+
+
+@click.command(help="Compare the find() based work parsing with the incremental parser")
+@click.option("-r", "--repeat", type=int, default=2000, help="Parses per measurement")
+@click.option("-b", "--bulk", type=int, default=1000, help="Works in the bulk document")
+def main(repeat: int, bulk: int):
+    single = tostring(work_element(0.5))
+    many = tostring(E.works(*(work_element(0.5) for _ in range(bulk))))
+    for name, fn, body, count, runs in (
+        ("find, single", find_parse, single, 1, repeat),
+        ("parser, single", parse_works, single, 1, repeat),
+        (f"find, {bulk} works", find_parse_bulk, many, bulk, max(repeat // bulk, 5)),
+        (f"parser, {bulk} works", parse_works, many, bulk, max(repeat // bulk, 5)),
+    ):
+        elapsed = measure(fn, body, runs)
+        print(f"{name:>20}: {elapsed * 1e6:,.0f} us/document, {count / elapsed:,.0f} works/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import random
+import time
+import uuid
+
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceRequest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, InstrumentationScope, KeyValue
+from opentelemetry.proto.logs.v1.logs_pb2 import LogRecord, ResourceLogs, ScopeLogs
+from opentelemetry.proto.resource.v1.resource_pb2 import Resource
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, Span, Status
+
+SPAN_NAMES = ("producer", "send", "parse", "translate", "nats", "nats-send", "process", "work receive")
+
+
+def kv(key: str, value: str | int | float | bool) -> KeyValue:
+    match value:
+        case bool():
+            any_value = AnyValue(bool_value=value)
+        case int():
+            any_value = AnyValue(int_value=value)
+        case float():
+            any_value = AnyValue(double_value=value)
+        case _:
+            any_value = AnyValue(string_value=value)
+    return KeyValue(key=key, value=any_value)
+
+
+def resource(index: int) -> Resource:
+    return Resource(
+        attributes=[
+            kv("service.name", f"client-{index}"),
+            kv("service.namespace", "OTEL-DEMO"),
+            kv("client_name", f"a:{index}"),
+            kv("used_queue", "a"),
+            kv("instance", str(index)),
+            kv("telemetry.sdk.language", "python"),
+            kv("telemetry.sdk.name", "opentelemetry"),
+            kv("telemetry.sdk.version", "1.27.0"),
+        ]
+    )
+
+
+def scope() -> InstrumentationScope:
+    return InstrumentationScope(name="rg-app.faststream.otel", version="0.0.1")
+
+
+def synthetic_span(trace_id: bytes, parent_span_id: bytes, start_ns: int, events: int) -> Span:
+    duration = random.randint(1_000_000, 2_000_000_000)
+    return Span(
+        trace_id=trace_id,
+        span_id=os.urandom(8),
+        parent_span_id=parent_span_id,
+        name=random.choice(SPAN_NAMES),
+        kind=Span.SpanKind.SPAN_KIND_INTERNAL,
+        start_time_unix_nano=start_ns,
+        end_time_unix_nano=start_ns + duration,
+        attributes=[
+            kv("work_id", f"work-{random.randint(1, 9999)}"),
+            kv("cid", uuid.uuid4().hex),
+            kv("status", 200),
+            kv("messaging.system", "nats"),
+        ],
+        events=[
+            Span.Event(
+                time_unix_nano=start_ns + duration * (i + 1) // (events + 1),
+                name=f"Processing {i + 1}/{events}",
+                attributes=[kv("sleep_time", random.randint(2, 10))],
+            )
+            for i in range(events)
+        ],
+        status=Status(code=random.choice((Status.STATUS_CODE_UNSET, Status.STATUS_CODE_OK))),
+    )
+
+
+def synthetic_trace_request(
+    resources: int = 4, spans_per_resource: int = 128, events_per_span: int = 2
+) -> ExportTraceServiceRequest:
+    now = time.time_ns()
+    resource_spans = []
+    for res_idx in range(resources):
+        spans = []
+        trace_id = os.urandom(16)
+        parent = b""
+        for span_idx in range(spans_per_resource):
+            if span_idx % 8 == 0:
+                trace_id = os.urandom(16)
+                parent = b""
+            span = synthetic_span(trace_id, parent, now - random.randint(0, 10**9), events_per_span)
+            parent = span.span_id
+            spans.append(span)
+        resource_spans.append(
+            ResourceSpans(resource=resource(res_idx), scope_spans=[ScopeSpans(scope=scope(), spans=spans)])
+        )
+    return ExportTraceServiceRequest(resource_spans=resource_spans)
+
+
+def synthetic_logs_request(resources: int = 4, logs_per_resource: int = 128) -> ExportLogsServiceRequest:
+    now = time.time_ns()
+    resource_logs = []
+    for res_idx in range(resources):
+        records = [
+            LogRecord(
+                time_unix_nano=now - random.randint(0, 10**9),
+                severity_text="INFO",
+                body=AnyValue(string_value=f'{{"work_id": "work-{random.randint(1, 9999)}", "repeat": 2}}'),
+                trace_id=os.urandom(16),
+                span_id=os.urandom(8),
+                attributes=[kv("code.function", "work_handler"), kv("code.lineno", 42)],
+            )
+            for _ in range(logs_per_resource)
+        ]
+        resource_logs.append(
+            ResourceLogs(resource=resource(res_idx), scope_logs=[ScopeLogs(scope=scope(), log_records=records)])
+        )
+    return ExportLogsServiceRequest(resource_logs=resource_logs)
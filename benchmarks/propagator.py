@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import click
+from httpx import AsyncClient, Limits
+from lxml.builder import E
+from lxml.etree import tostring
+
+from otel_demo.apps.producer import work_element
+
+
+def work_document(delay: float, bulk: int) -> str:
+    if bulk:
+        return tostring(E.works(*(work_element(delay) for _ in range(bulk))), encoding="unicode")
+    return tostring(work_element(delay), encoding="unicode")
+
+
+async def worker(
+    client: AsyncClient, target: str, deadline: float, delay: float, bulk: int, latencies: list[float]
+) -> int:
+    errors = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.post(target, content=work_document(delay, bulk))
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+    return errors
+
+
+async def run(target: str, concurrency: int, duration: float, delay: float, bulk: int):
+    latencies: list[float] = []
+    async with AsyncClient(limits=Limits(max_connections=concurrency), timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        workers = (worker(client, target, deadline, delay, bulk, latencies) for _ in range(concurrency))
+        errors = await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    ok = len(latencies)
+    print(f"{ok} requests in {elapsed:.1f}s -> {ok / elapsed:,.0f} req/s, {sum(errors)} errors")
+    if bulk:
+        print(f"{ok * bulk / elapsed:,.0f} works/s")
+    if ok:
+        p50, p99 = latencies[ok // 2], latencies[min(ok - 1, int(ok * 0.99))]
+        print(f"latency p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+
+
+@click.command(help="Closed-loop load against a running propagator, reports requests/s and latency")
+@click.option("-t", "--target", default="http://localhost:8000/recieve")
+@click.option("-c", "--concurrency", type=int, default=32, help="Requests in flight")
+@click.option("-d", "--duration", type=float, default=10.0, help="Seconds to run")
+@click.option("--delay", type=float, default=0.0, help="Delay element of the generated work")
+@click.option("-b", "--bulk", type=int, default=0, help="Works per `<works>` request, use with /recieve/bulk")
+def main(target: str, concurrency: int, duration: float, delay: float, bulk: int):
+    asyncio.run(run(target, concurrency, duration, delay, bulk))
+
+
+if __name__ == "__main__":
+    main()
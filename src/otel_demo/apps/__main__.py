@@ -1,10 +1,14 @@
 import asyncio
+import multiprocessing
+import signal
 
 import click
 
-from .client import app_factory
+from .client import run_app
+from .producer import load as producer_load
 from .producer import main as producer_main
 from .propagator import main as propagator_main
+from .stream import JETSTREAM_ENV
 
 
 @click.group()
@@ -12,29 +16,63 @@ def cli():
     pass
 
 
-@cli.command(help="Run producer")
+@cli.command(help="Run producer, or with --rate generate load and report latency percentiles and errors")
 @click.option("-t", "--target", "target", type=str, help="HTTP address of target", required=False)
-def producer(target: str | None = None):
-    asyncio.run(producer_main(target))
+@click.option("-r", "--rate", "rate", type=float, help="Requests per second, sent on a fixed schedule", required=False)
+@click.option("-d", "--duration", "duration", type=float, default=30.0, help="Seconds of load")
+@click.option("-c", "--concurrency", "concurrency", type=int, default=64, help="Max requests in flight (connections)")
+@click.option("--delay", "delay", type=float, help="Delay element of the generated work, random by default")
+def producer(
+    target: str | None = None,
+    rate: float | None = None,
+    duration: float = 30.0,
+    concurrency: int = 64,
+    delay: float | None = None,
+):
+    if rate is None:
+        asyncio.run(producer_main(target))
+    else:
+        asyncio.run(producer_load(target, rate, duration, concurrency, delay))
 
 
 @cli.command(help="Run propagator")
-def propagator():
-    propagator_main()
-
-
-@cli.command(help="Run client")
-def client():
-    asyncio.run(client_mltp())
-
-
-async def client_mltp():
-    app_a1 = app_factory("a:1")
-    app_a2 = app_factory("a:2")
-    app_b1 = app_factory("b:1")
-    app_b2 = app_factory("b:2")
-
-    await asyncio.gather(app_a1.run(), app_a2.run(), app_b1.run(), app_b2.run())
+@click.option("-w", "--workers", "workers", type=int, default=1, help="Uvicorn worker processes")
+@click.option("--production", is_flag=True, help="Skip the simulated delay, turn off debug and the access log")
+@click.option("--jetstream", is_flag=True, envvar=JETSTREAM_ENV, help="Publish to the durable JetStream stream")
+def propagator(workers: int, production: bool, jetstream: bool):
+    propagator_main(workers, production, jetstream)
+
+
+@cli.command(help="Run client processes, each queue group gets every work once")
+@click.option("-g", "--group", "groups", multiple=True, default=["a", "b"], help="Queue groups")
+@click.option("-p", "--processes", "processes", type=int, default=2, help="Client processes per queue group")
+@click.option("-c", "--concurrency", "concurrency", type=int, default=1, help="Works processed at once per process")
+@click.option("-b", "--batch-size", "batch_size", type=int, default=0, help="Pull works in batches from the stream")
+@click.option("--jetstream", is_flag=True, envvar=JETSTREAM_ENV, help="Pull works from the durable JetStream stream")
+def client(groups: list[str], processes: int, concurrency: int, batch_size: int, jetstream: bool):
+    names = [f"{group}:{index}" for group in groups for index in range(1, processes + 1)]
+    client_mltp(names, concurrency, batch_size, jetstream)
+
+
+def client_mltp(names: list[str], concurrency: int, batch_size: int, jetstream: bool):
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_app, args=(name, concurrency, batch_size, jetstream), name=f"client-{name}")
+        for name in names
+    ]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        # FastStream apps shut down gracefully on SIGTERM
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for worker in workers:
+        worker.join()
 
 
 def main():
@@ -6,13 +6,14 @@ from typing import Any, Awaitable, Callable
 
 from faststream import Depends, FastStream
 from faststream.asyncapi import get_app_schema
-from faststream.nats import NatsBroker, NatsRouter
-from opentelemetry.trace import Tracer, get_current_span
+from faststream.nats import NatsBroker, NatsRouter, PullSub
+from opentelemetry.trace import Span, Tracer, get_current_span
 
 from otel_demo.utils.base import get_otel_settings
 from otel_demo.utils.faststream import OtelBundle, otel_logger, prepare_bundle, tracer_fn
 
 from .models import Work
+from .stream import WORK_SUBJECT, work_consumer, work_stream
 
 
 def get_otel_bundle() -> OtelBundle:
@@ -20,11 +21,60 @@ def get_otel_bundle() -> OtelBundle:
     return prepare_bundle(settings)
 
 
-def router_factory(name: str) -> NatsRouter:
+async def process_work(data: Work, tracer: Tracer, main_span: Span):
+    with tracer.start_as_current_span("process") as process_span:
+        main_span.set_attribute("work_id", data.work_id)
+        main_span.set_attribute("cid", data.cid)
+        repeat = data.repeat
+        for i in range(repeat):
+            await asyncio.sleep(data.delay)
+            process_span.add_event(f"Processing {i + 1}/{repeat}")
+
+
+def router_factory(name: str, concurrency: int = 1, batch_size: int = 0, jetstream: bool = False) -> NatsRouter:
     router = NatsRouter()
     used_queue, _ = name.split(":", 1)
 
-    @router.subscriber("work", queue=used_queue)
+    if batch_size:
+        # instances of a queue group share the durable pull consumer the same way they share a queue subscription
+        @router.subscriber(
+            WORK_SUBJECT,
+            stream=work_stream(),
+            durable=f"work-{used_queue}",
+            config=work_consumer(used_queue),
+            pull_sub=PullSub(batch_size=batch_size, batch=True),
+        )
+        async def works_handler(
+            data: list[Work],
+            tracer: Tracer = Depends(tracer_fn),
+            otel_logger=Depends(otel_logger),
+        ):
+            otel_logger.info("Got %d works", len(data))
+            main_span = get_current_span()
+            main_span.add_event("I got some work", {"works": len(data)})
+            slots = asyncio.Semaphore(concurrency)
+
+            async def process(work: Work):
+                async with slots:
+                    await process_work(work, tracer, main_span)
+
+            await asyncio.gather(*(process(work) for work in data))
+
+        return router
+
+    if jetstream:
+        subscriber = router.subscriber(
+            WORK_SUBJECT,
+            stream=work_stream(),
+            durable=f"work-{used_queue}",
+            config=work_consumer(used_queue),
+            pull_sub=PullSub(batch_size=concurrency),
+            max_workers=concurrency,
+        )
+    else:
+        subscriber = router.subscriber(WORK_SUBJECT, queue=used_queue, max_workers=concurrency)
+
+    @subscriber
     async def work_handler(
         data: Work,
         tracer: Tracer = Depends(tracer_fn),
@@ -34,19 +84,12 @@ def router_factory(name: str) -> NatsRouter:
         otel_logger.info(data.model_dump_json())
         main_span = get_current_span()
         main_span.add_event("I got some work")
-
-        with tracer.start_as_current_span("process") as process_span:
-            main_span.set_attribute("work_id", data.work_id)
-            main_span.set_attribute("cid", data.cid)
-            repeat = data.repeat
-            for i in range(repeat):
-                await asyncio.sleep(data.delay)
-                process_span.add_event(f"Processing {i+1}/{repeat}")
+        await process_work(data, tracer, main_span)
 
     return router
 
 
-def app_factory(name: str) -> FastStream:
+def app_factory(name: str, concurrency: int = 1, batch_size: int = 0, jetstream: bool = False) -> FastStream:
     log_level = logging.DEBUG
 
     used_queue, instance = name.split(":", 1)
@@ -60,7 +103,7 @@ def app_factory(name: str) -> FastStream:
         log_level=log_level,
         middlewares=(otel_bundle.middeware,) if otel_bundle else [],
     )
-    broker.include_routers(router_factory(name))
+    broker.include_routers(router_factory(name, concurrency, batch_size, jetstream))
 
     on_startup: list[Callable[..., Awaitable[Any]]] = []
     if otel_bundle:
@@ -73,5 +116,9 @@ def app_factory(name: str) -> FastStream:
     return app
 
 
+def run_app(name: str, concurrency: int = 1, batch_size: int = 0, jetstream: bool = False):
+    asyncio.run(app_factory(name, concurrency, batch_size, jetstream).run())
+
+
 def app_schema() -> str:
     return get_app_schema(app_factory("a:0")).to_yaml()
@@ -0,0 +1,65 @@
+from collections.abc import Iterator
+
+from lxml import etree
+from pydantic import ValidationError
+
+from .models import Work
+
+# element name -> Work field
+WORK_FIELDS = {
+    "workid": "work_id",
+    "cid": "cid",
+    "repeat": "repeat",
+    "delay": "delay",
+    "no_val1": "no_val1",
+    "no_val2": "no_val2",
+    "str_val1": "str_val1",
+    "str_val2": "str_val2",
+}
+
+
+class WorkParseError(ValueError):
+    pass
+
+
+class WorkParser:
+    """Incremental parser of `<work>` documents, either a single `<work>` or many inside one root element.
+
+    Bytes can be fed as they arrive. Every `<work>` becomes a `Work` as soon as its closing tag is parsed and is then
+    dropped from the tree, so memory stays bounded by one document. Unknown elements inside `<work>` are ignored.
+    """
+
+    def __init__(self):
+        self.parser = etree.XMLPullParser(events=("end",), tag="work", resolve_entities=False, no_network=True)
+
+    def feed(self, data: bytes) -> list[Work]:
+        try:
+            self.parser.feed(data)
+        except etree.XMLSyntaxError as e:
+            raise WorkParseError(f"Malformed XML: {e}") from e
+        return list(self.works())
+
+    def close(self) -> list[Work]:
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError as e:
+            raise WorkParseError(f"Malformed XML: {e}") from e
+        return list(self.works())
+
+    def works(self) -> Iterator[Work]:
+        for _, element in self.parser.read_events():
+            fields = {WORK_FIELDS[child.tag]: child.text for child in element if child.tag in WORK_FIELDS}
+            try:
+                yield Work.model_validate(fields)
+            except ValidationError as e:
+                raise WorkParseError(f"Invalid work: {e}") from e
+            finally:
+                element.clear()
+                # earlier documents are done, drop them from the root
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+
+def parse_works(body: bytes) -> list[Work]:
+    parser = WorkParser()
+    return parser.feed(body) + parser.close()
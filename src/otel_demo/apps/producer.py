@@ -1,15 +1,36 @@
 import asyncio
 import random
+import time
 import uuid
+from collections import Counter
+from dataclasses import dataclass, field
 
-from httpx import AsyncClient
+from httpx import AsyncClient, Limits
 from lxml.builder import E
-from lxml.etree import tostring
+from lxml.etree import _Element, tostring
 from opentelemetry import trace
 from opentelemetry.propagate import inject
+from opentelemetry.trace import Tracer
 
 from otel_demo.utils.base import get_otel_settings, prepare_utils
 
+DEFAULT_TARGET = "http://localhost:8000/recieve"
+
+
+def work_element(delay: float | None = None) -> _Element:
+    if delay is None:
+        delay = random.random() * 2 + 0.5
+    return E.work(
+        E.workid(f"work-{random.randint(1, 9999)}"),
+        E.cid(uuid.uuid4().hex),
+        E.repeat(f"{random.randint(1, 3)}"),
+        E.delay(f"{delay:.2f}"),
+        E.no_val1(f"{random.randint(1, 100)}"),
+        E.no_val2(f"{random.randint(1, 100)}"),
+        E.str_val1(f"str-{random.randint(1, 100)}"),
+        E.str_val2(f"str-{random.randint(1, 100)}"),
+    )
+
 
 async def main(target: str | None = None):
     settings = get_otel_settings()
@@ -18,23 +39,12 @@ async def main(target: str | None = None):
     tracer = tracer_provider.get_tracer(__name__)
 
     if target is None:
-        target = "http://localhost:8000/recieve"
+        target = DEFAULT_TARGET
     while True:
         with tracer.start_as_current_span("producer") as span:
             span.set_attribute("target", target)
-            work_id = f"work-{random.randint(1, 9999)}"
-            cid = uuid.uuid4().hex
-
-            work = E.work(
-                E.workid(work_id),
-                E.cid(cid),
-                E.repeat(f"{random.randint(1, 3)}"),
-                E.delay(f"{random.random()*2+0.5:.2f}"),
-                E.no_val1(f"{random.randint(1, 100)}"),
-                E.no_val2(f"{random.randint(1, 100)}"),
-                E.str_val1(f"str-{random.randint(1, 100)}"),
-                E.str_val2(f"str-{random.randint(1, 100)}"),
-            )
+            work = work_element()
+            work_id, cid = work.findtext("workid"), work.findtext("cid")
             span.set_attribute("work_id", work_id)
             span.set_attribute("cid", cid)
 
@@ -53,3 +63,88 @@ async def main(target: str | None = None):
             sleep_time = random.randint(2, 10)
             span.add_event(f"Will sleep for {sleep_time}", {"sleep_time": sleep_time})
         await asyncio.sleep(sleep_time)
+
+
+@dataclass
+class LoadResult:
+    latencies: list[float] = field(default_factory=list)
+    errors: Counter[str] = field(default_factory=Counter)
+    # requests that waited for a connection because `concurrency` requests were in flight
+    queued: int = 0
+
+    def report(self, elapsed: float) -> str:
+        errors = sum(self.errors.values())
+        total = len(self.latencies) + errors
+        lines = [
+            f"{total} requests in {elapsed:.1f}s -> {total / elapsed:,.0f} req/s",
+            f"ok {len(self.latencies)}, errors {errors} ({errors / max(total, 1):.2%}), queued {self.queued}",
+        ]
+        lines += [f"  {error}: {count}" for error, count in self.errors.most_common()]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            percentiles = ", ".join(
+                f"p{q:g} {latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))] * 1000:.1f}"
+                for q in (50, 90, 99, 99.9)
+            )
+            lines.append(f"latency ms: {percentiles}, max {latencies[-1] * 1000:.1f}")
+        return "\n".join(lines)
+
+
+async def send(
+    client: AsyncClient,
+    tracer: Tracer,
+    target: str,
+    body: str,
+    scheduled: float,
+    slots: asyncio.Semaphore,
+    result: LoadResult,
+):
+    if slots.locked():
+        result.queued += 1
+    async with slots:
+        with tracer.start_as_current_span("send", kind=trace.SpanKind.PRODUCER) as span:
+            headers = {}
+            inject(headers)
+            try:
+                response = await client.post(target, content=body, headers=headers)
+                span.set_attribute("status", response.status_code)
+            except Exception as e:
+                span.record_exception(e)
+                result.errors[type(e).__name__] += 1
+                return
+    if response.is_success:
+        # measured from the scheduled start, so time spent waiting for a free connection counts as latency
+        result.latencies.append(time.perf_counter() - scheduled)
+    else:
+        result.errors[f"HTTP {response.status_code}"] += 1
+
+
+async def load(
+    target: str | None = None,
+    rate: float = 100.0,
+    duration: float = 30.0,
+    concurrency: int = 64,
+    delay: float | None = None,
+) -> LoadResult:
+    """Sends work at a fixed rate (open loop) for `duration` seconds with at most `concurrency` requests in flight."""
+    settings = get_otel_settings()
+    _, tracer_provider, _ = prepare_utils(settings)
+    tracer = tracer_provider.get_tracer(__name__)
+
+    target = target or DEFAULT_TARGET
+    result = LoadResult()
+    slots = asyncio.Semaphore(concurrency)
+    limits = Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with AsyncClient(limits=limits, timeout=30) as client:
+        tasks: list[asyncio.Task] = []
+        started = time.perf_counter()
+        for index in range(int(rate * duration)):
+            # the schedule doesn't wait for responses, a slow target can't slow down the senders
+            scheduled = started + index / rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            body = tostring(work_element(delay), encoding="unicode")
+            tasks.append(asyncio.create_task(send(client, tracer, target, body, scheduled, slots, result)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    print(result.report(elapsed))
+    return result
@@ -1,70 +1,146 @@
 import asyncio
 import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from logging import Logger
 
-import nats
 import uvicorn
 from litestar import Litestar, Request, post
-from lxml import etree
+from litestar.datastructures import State
+from litestar.di import Provide
+from litestar.exceptions import ClientException, ServiceUnavailableException
+from nats.aio.client import Client
+from nats.errors import Error as NatsError
 from opentelemetry.propagate import inject
 from opentelemetry.trace import SpanKind, Tracer, get_current_span
 
 from otel_demo.utils.base import get_otel_settings
 from otel_demo.utils.litestar import prepare_plugins
+from otel_demo.utils.nats import NatsPool
 
 from .models import Work
+from .parsing import WorkParseError, WorkParser
+from .stream import JETSTREAM_ENV, WORK_SUBJECT, declare_work_stream
 
 NATS_URL = os.getenv("APP_NATS_URL", "nats://127.0.0.1:4222")
+NATS_POOL_SIZE = int(os.getenv("APP_NATS_POOL_SIZE", "1"))
+PUBLISH_WINDOW = int(os.getenv("APP_NATS_PUBLISH_WINDOW", "256"))
+PRODUCTION_ENV = "APP_PROPAGATOR_PRODUCTION"
+
+
+@asynccontextmanager
+async def nats_lifespan(app: Litestar) -> AsyncIterator[None]:
+    async with NatsPool(NATS_URL, NATS_POOL_SIZE, name="propagator") as pool:
+        if app.state.jetstream:
+            await declare_work_stream(pool.get())
+        app.state.nats = pool
+        yield
+
+
+def provide_nats(state: State) -> Client:
+    return state.nats.get()
+
+
+async def publish(nc: Client, works: list[Work], headers: dict[str, str], jetstream: bool):
+    if not jetstream:
+        for work in works:
+            # only queued on the shared connection, its flusher batches writes to the server
+            await nc.publish(WORK_SUBJECT, work.model_dump_json().encode(), headers=headers)
+        return
+    js = nc.jetstream()
+    # the message id makes retried works idempotent within the stream's duplicate window
+    messages = [(work.model_dump_json().encode(), {**headers, "Nats-Msg-Id": work.cid}) for work in works]
+    try:
+        for start in range(0, len(messages), PUBLISH_WINDOW):
+            # a window of publishes is in flight at once and their acks are awaited together
+            window = messages[start : start + PUBLISH_WINDOW]
+            publishes = (js.publish(WORK_SUBJECT, payload, headers=msg_headers) for payload, msg_headers in window)
+            await asyncio.gather(*publishes)
+    except NatsError as e:
+        raise ServiceUnavailableException("Work stream did not acknowledge the publish") from e
+
+
+async def read_works(request: Request) -> list[Work]:
+    parser = WorkParser()
+    works: list[Work] = []
+    try:
+        async for chunk in request.stream():
+            works += parser.feed(chunk)
+        works += parser.close()
+    except WorkParseError as e:
+        raise ClientException(str(e)) from e
+    return works
 
 
 @post("/recieve")
-async def recieve(request: Request, tracer: Tracer, otel_logger: Logger) -> str:
-    with tracer.start_as_current_span("parse") as span:
-        body = await request.body()
-        otel_logger.info(body.decode())
-        data_parsed = etree.fromstring(body)
+async def recieve(request: Request, state: State, tracer: Tracer, otel_logger: Logger, nc: Client) -> str:
+    with tracer.start_as_current_span("parse"):
+        works = await read_works(request)
+    if len(works) != 1:
+        raise ClientException(f"Expected one work, got {len(works)}")
+    work = works[0]
     span_base = get_current_span()
+    span_base.set_attribute("cid", work.cid)
+    span_base.set_attribute("work_id", work.work_id)
+
+    if not state.production:
+        with tracer.start_as_current_span("translate"):
+            # demo latency only, clients already spend `delay` per repeat processing the work
+            await asyncio.sleep(work.delay)
 
-    cid_el = data_parsed.find("cid")
-    assert cid_el is not None, "No cid found in the data"
-    span_base.set_attribute("cid", cid_el.text or "no-cid")
-
-    work_id_el = data_parsed.find("workid")
-    assert work_id_el is not None, "No workid found in the data"
-    span_base.set_attribute("work_id", work_id_el.text or "no-workid")
-
-    with tracer.start_as_current_span("translate") as span:
-        delay_el = data_parsed.find("delay")
-        assert delay_el is not None, "No delay found in the data"
-        await asyncio.sleep(float(delay_el.text or "0"))
-        work = Work(
-            work_id=work_id_el.text,  # type: ignore
-            cid=cid_el.text,  # type: ignore
-            repeat=int(data_parsed.find("repeat").text),  # type: ignore
-            delay=float(delay_el.text),  # type: ignore
-            no_val1=int(data_parsed.find("no_val1").text),  # type: ignore
-            no_val2=int(data_parsed.find("no_val2").text),  # type: ignore
-            str_val1=data_parsed.find("str_val1").text,  # type: ignore
-            str_val2=data_parsed.find("str_val2").text,  # type: ignore
-        )
-        serialized = work.model_dump_json()
-
-    with tracer.start_as_current_span("nats") as span:
-        with tracer.start_as_current_span("nats-setup") as span:
-            nc = await nats.connect(NATS_URL)
+    with tracer.start_as_current_span("nats"):
         headers = {}
         inject(headers)
-        with tracer.start_as_current_span("nats-send", kind=SpanKind.PRODUCER) as span:
-            await nc.publish("work", serialized.encode(), headers=headers)
-            otel_logger.info(serialized)
-        with tracer.start_as_current_span("nats-close") as span:
-            await nc.close()
+        with tracer.start_as_current_span("nats-send", kind=SpanKind.PRODUCER):
+            await publish(nc, works, headers, state.jetstream)
+            otel_logger.info("Published work %s", work.work_id)
 
     return "OK!"
 
 
-def main():
+@post("/recieve/bulk")
+async def recieve_bulk(request: Request, state: State, tracer: Tracer, otel_logger: Logger, nc: Client) -> str:
+    """Accepts `<works>` with many `<work>` documents and publishes each one."""
+    with tracer.start_as_current_span("parse"):
+        works = await read_works(request)
+    get_current_span().set_attribute("works", len(works))
+
+    with tracer.start_as_current_span("nats"):
+        headers = {}
+        inject(headers)
+        with tracer.start_as_current_span("nats-send", kind=SpanKind.PRODUCER):
+            await publish(nc, works, headers, state.jetstream)
+    otel_logger.info("Published %d works", len(works))
+
+    return "OK!"
+
+
+def create_app() -> Litestar:
+    production = os.getenv(PRODUCTION_ENV, "0") == "1"
+    jetstream = os.getenv(JETSTREAM_ENV, "0") == "1"
     settings = get_otel_settings()
     plugins = prepare_plugins(settings)
-    app = Litestar([recieve], plugins=plugins, debug=True)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    return Litestar(
+        [recieve, recieve_bulk],
+        plugins=plugins,
+        lifespan=[nats_lifespan],
+        dependencies={"nc": Provide(provide_nats, sync_to_thread=False)},
+        state=State({"production": production, "jetstream": jetstream}),
+        debug=not production,
+    )
+
+
+def main(workers: int = 1, production: bool = False, jetstream: bool = False):
+    # worker processes build their own app from the environment
+    if production:
+        os.environ[PRODUCTION_ENV] = "1"
+    if jetstream:
+        os.environ[JETSTREAM_ENV] = "1"
+    uvicorn.run(
+        f"{__name__}:create_app",
+        factory=True,
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        access_log=not production,
+    )
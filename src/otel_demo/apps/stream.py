@@ -0,0 +1,46 @@
+import os
+
+from faststream.nats import JStream
+from nats.aio.client import Client
+from nats.js.api import AckPolicy, ConsumerConfig, RetentionPolicy, StorageType
+from nats.js.errors import BadRequestError
+
+WORK_SUBJECT = "work"
+WORK_STREAM = "work"
+
+JETSTREAM_ENV = "APP_NATS_JETSTREAM"
+STREAM_MAX_AGE = float(os.getenv("APP_NATS_STREAM_MAX_AGE", "86400"))
+STREAM_MAX_BYTES = int(os.getenv("APP_NATS_STREAM_MAX_BYTES", str(1024**3)))
+MAX_ACK_PENDING = int(os.getenv("APP_NATS_MAX_ACK_PENDING", "1000"))
+# publishes with the same Nats-Msg-Id within this many seconds are stored once
+DUPLICATE_WINDOW = 120.0
+
+
+def work_stream() -> JStream:
+    """Durable stream of works, a work is removed once every queue group's consumer acked it."""
+    return JStream(
+        WORK_STREAM,
+        subjects=[WORK_SUBJECT],
+        retention=RetentionPolicy.INTEREST,
+        storage=StorageType.FILE,
+        max_age=STREAM_MAX_AGE,
+        max_bytes=STREAM_MAX_BYTES,
+        duplicate_window=DUPLICATE_WINDOW,
+    )
+
+
+def work_consumer(group: str) -> ConsumerConfig:
+    # at most MAX_ACK_PENDING works handed out and not yet acked, the server stops delivering beyond that
+    return ConsumerConfig(durable_name=f"work-{group}", ack_policy=AckPolicy.EXPLICIT, max_ack_pending=MAX_ACK_PENDING)
+
+
+async def declare_work_stream(nc: Client):
+    stream = work_stream()
+    config = stream.config
+    config.subjects = [WORK_SUBJECT]
+    js = nc.jetstream()
+    try:
+        await js.add_stream(config)
+    except BadRequestError:
+        # exists with other limits, e.g. after changing APP_NATS_STREAM_MAX_AGE
+        await js.update_stream(config)
@@ -1,211 +1,284 @@
 # __init__.py
 # from concurrent import futures
 import asyncio
-import hashlib
 import logging
-import os
-import uuid
-from contextlib import asynccontextmanager
-from datetime import UTC, datetime
+from collections.abc import Sequence
+from contextlib import asynccontextmanager, suppress
 
 import grpc
-from google.protobuf.internal.containers import RepeatedCompositeFieldContainer
+import uvicorn
+from google.protobuf.message import DecodeError
 from grpc_reflection.v1alpha import reflection
 from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import DESCRIPTOR as LOGS_DESCRIPTOR
-from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceRequest, ExportLogsServiceResponse
-from opentelemetry.proto.collector.logs.v1.logs_service_pb2_grpc import LogsServiceServicer as OGLogsServiceServicer
-from opentelemetry.proto.collector.logs.v1.logs_service_pb2_grpc import add_LogsServiceServicer_to_server
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceResponse
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import DESCRIPTOR as METRICS_DESCRIPTOR
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceResponse
 from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import DESCRIPTOR as TRACE_DESCRIPTOR
 
 # from opentelemetry.proto.collector.trace.v1.trace_service_pb2_grpc import TraceServiceStub
-from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
-    ExportTraceServiceRequest,
-    ExportTraceServiceResponse,
-)
-from opentelemetry.proto.collector.trace.v1.trace_service_pb2_grpc import TraceServiceServicer as OGTraceServiceServicer
-from opentelemetry.proto.collector.trace.v1.trace_service_pb2_grpc import add_TraceServiceServicer_to_server
-from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-
-from .tables import Base, Event, Log, Span
-
-logging.basicConfig(level=logging.DEBUG)
-
-
-def extract_anyvalue(value: AnyValue):
-    stupid_wrapper_helper = value.WhichOneof("value")
-    if stupid_wrapper_helper:
-        return getattr(value, stupid_wrapper_helper)
-    else:
-        return None
-
-
-def normalize_attributes(attributes: RepeatedCompositeFieldContainer[KeyValue]):
-    dct_attr = {}
-    for a in attributes:
-        dct_attr[a.key] = extract_anyvalue(a.value)
-    return dct_attr
-
-
-def bytes_to_hex_str(b: bytes) -> str:
-    return b.hex()
-
-
-class LogService(OGLogsServiceServicer):
-    def __init__(self, sessionmaker: async_sessionmaker) -> None:
-        super().__init__()
-        self.sessionmaker = sessionmaker
-
-    async def Export(self, request: ExportLogsServiceRequest, ctx: grpc.ServicerContext) -> ExportLogsServiceResponse:
-        log_objs = []
-        for res_log in request.resource_logs:
-            resource_attr = normalize_attributes(res_log.resource.attributes)
-            for scp_log in res_log.scope_logs:
-                scp_attr = normalize_attributes(scp_log.scope.attributes)
-                for log_record in scp_log.log_records:
-                    log_attrs = normalize_attributes(log_record.attributes)
-                    trace_id = bytes_to_hex_str(log_record.trace_id) if log_record.trace_id else None
-                    span_id = bytes_to_hex_str(log_record.span_id) if log_record.span_id else None
-                    if trace_id and span_id:
-                        identifier = f"{trace_id}-{span_id}-{log_record.time_unix_nano}"
-                        identifier_hash = hashlib.sha1(identifier.encode()).hexdigest()
-                        attributes = {**resource_attr, **scp_attr, **log_attrs, "exp_identifier": identifier_hash}
-                        log_obj = Log(
-                            trace_id=trace_id,
-                            span_id=span_id,
-                            log_id=uuid.uuid4(),
-                            severity=log_record.severity_text,
-                            time=datetime.fromtimestamp(log_record.time_unix_nano / 1e9, tz=UTC),
-                            attributes=attributes,
-                            body=extract_anyvalue(log_record.body),
-                        )
-                        log_objs.append(log_obj)
-                        # print(f"resource: {res_log.resource}")
-                        # print(f"scope: {scp_log.scope}")
-                        # print(f"record: {log_record}")
-                        # print(f"attributes: {normalize_attributes(log_record.attributes)}")
-                        # print(f"body: {extract_anyvalue(log_record.body)}")
-                        # print(f"severity: {log_record.severity_number}")
-                        # print(f"severity_txt: {log_record.severity_text}")
-                        # print(f"timestamp: {datetime.fromtimestamp(log_record.time_unix_nano / 1e9, tz=UTC)}")
-                        # print(f"span_id: {bytes_to_hex_str(log_record.span_id) if log_record.span_id else None}")
-                        # print(f"trace_id: {bytes_to_hex_str(log_record.trace_id) if log_record.trace_id else None}")
-                        # print(f"identifier: {identifier_hash}")
-        async with self.sessionmaker() as session:
-            session: AsyncSession
-            session.add_all(log_objs)
-            await session.commit()
-        print(f"logs: {len(log_objs)}")
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceResponse
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from .admin import admin_server
+from .buffer import BufferFull, WriteBehindBuffer
+from .decode_pool import DecodePool
+from .dedup import DedupFilter
+from .ingest import BulkWriter
+from .intern import InternCache
+from .otlp_http import http_server
+from .partitions import PartitionManager
+from .profiler import SamplingProfiler
+from .sampling import TailSampler
+from .settings import ExporterSettings, get_exporter_settings
+from .spool import Spool, SpoolFull, SpoolReplayer
+from .tables import schema_metadata
+from .telemetry import record_request, setup_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+async def export(
+    kind: str,
+    request: bytes,
+    ctx: grpc.ServicerContext,
+    decoder: DecodePool,
+    buffer: WriteBehindBuffer | TailSampler,
+    spool: Spool | None,
+):
+    outcome = "accepted"
+    try:
+        if spool is not None:
+            await spool.append(kind, request)
+        else:
+            batch = await getattr(decoder, kind)(request)
+            buffer.put(batch)
+            logger.debug("%s: %d rows", kind, batch.row_count())
+    except DecodeError as e:
+        outcome = "invalid"
+        await ctx.abort(grpc.StatusCode.INVALID_ARGUMENT, f"malformed request: {e}")
+    except (BufferFull, SpoolFull) as e:
+        outcome = "rejected"
+        # the collector retries RESOURCE_EXHAUSTED with backoff instead of dropping the batch
+        await ctx.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+    finally:
+        record_request(kind, "grpc", len(request), outcome)
+
+
+class LogService:
+    def __init__(self, decoder: DecodePool, buffer: WriteBehindBuffer, spool: Spool | None = None) -> None:
+        self.decoder = decoder
+        self.buffer = buffer
+        self.spool = spool
+
+    async def Export(self, request: bytes, ctx: grpc.ServicerContext) -> ExportLogsServiceResponse:
+        await export("logs", request, ctx, self.decoder, self.buffer, self.spool)
         return ExportLogsServiceResponse()
 
 
-class TraceService(OGTraceServiceServicer):
-    def __init__(self, sessionmaker: async_sessionmaker) -> None:
-        super().__init__()
-        self.sessionmaker = sessionmaker
-
-    async def Export(self, request: ExportTraceServiceRequest, ctx: grpc.ServicerContext) -> ExportTraceServiceResponse:
-        span_objs = []
-        event_objs = []
-        for res_span in request.resource_spans:
-            resource_attr = normalize_attributes(res_span.resource.attributes)
-            for scp_span in res_span.scope_spans:
-                scp_attr = normalize_attributes(scp_span.scope.attributes)
-                for span in scp_span.spans:
-                    # print(f"span name: {span.name}")
-                    # print(f"start time: {span.start_time_unix_nano}")
-                    # print(f"end time: {span.end_time_unix_nano}")
-                    # print(f"trace id: {span.trace_id}")
-                    # print(f"span id: {span.span_id}")
-                    # print(f"parent span id: {span.parent_span_id}")
-                    # print(f"kind: {span.kind}")
-                    # print(f"status: {span.status}")
-                    # print(f"attributes: {span.attributes}")
-                    # print(f"events: {span.events}")
-                    # print(f"links: {span.links}")
-                    # print(f"dropped attributes count: {span.dropped_attributes_count}")
-                    # print(f"dropped events count: {span.dropped_events_count}")
-                    # print(f"dropped links count: {span.dropped_links_count}")
-                    # print(f"status: {span.status}")
-                    # print(f"start time: {span.start_time_unix_nano}")
-                    # print(f"end time: {span.end_time_unix_nano}")
-                    # print(f"trace state: {span.trace_state}")
-                    span_attrs = normalize_attributes(span.attributes)
-                    join_attrs = {**resource_attr, **scp_attr, **span_attrs}
-                    span_obj = Span(
-                        trace_id=bytes_to_hex_str(span.trace_id),
-                        span_id=bytes_to_hex_str(span.span_id),
-                        parent_span_id=bytes_to_hex_str(span.parent_span_id) if span.parent_span_id else None,
-                        start_time=datetime.fromtimestamp(span.start_time_unix_nano / 1e9, tz=UTC),
-                        end_time=datetime.fromtimestamp(span.end_time_unix_nano / 1e9, tz=UTC),
-                        name=span.name,
-                        status=span.status.code,
-                        attributes=join_attrs,
-                        state=span.trace_state,
-                    )
-                    span_objs.append(span_obj)
-                    for event_id, event in enumerate(span.events):
-                        # print(f"event name: {event.name}")
-                        # print(f"event time: {event.time_unix_nano}")
-                        # print(f"attributes: {event.attributes}")
-                        event_attrs = normalize_attributes(event.attributes)
-
-                        event_obj = Event(
-                            trace_id=bytes_to_hex_str(span.trace_id),
-                            span_id=bytes_to_hex_str(span.span_id),
-                            event_no=event_id,
-                            time=datetime.fromtimestamp(event.time_unix_nano / 1e9, tz=UTC),
-                            name=event.name,
-                            attributes=event_attrs,
-                        )
-                        event_objs.append(event_obj)
-        print(f"span_objs: {len(span_objs)}")
-        print(f"event_objs: {len(event_objs)}")
-        async with self.sessionmaker() as session:
-            session: AsyncSession
-            session.add_all(span_objs)
-            session.add_all(event_objs)
-            await session.commit()
-            # await session.flush()
-            # res = await session.execute(text("SELECT 1;"))
-            # print(res.scalar())
+class TraceService:
+    def __init__(
+        self, decoder: DecodePool, buffer: WriteBehindBuffer | TailSampler, spool: Spool | None = None
+    ) -> None:
+        self.decoder = decoder
+        self.buffer = buffer
+        self.spool = spool
+
+    async def Export(self, request: bytes, ctx: grpc.ServicerContext) -> ExportTraceServiceResponse:
+        await export("traces", request, ctx, self.decoder, self.buffer, self.spool)
         return ExportTraceServiceResponse()
 
 
+class MetricsService:
+    def __init__(self, decoder: DecodePool, buffer: WriteBehindBuffer, spool: Spool | None = None) -> None:
+        self.decoder = decoder
+        self.buffer = buffer
+        self.spool = spool
+
+    async def Export(self, request: bytes, ctx: grpc.ServicerContext) -> ExportMetricsServiceResponse:
+        await export("metrics", request, ctx, self.decoder, self.buffer, self.spool)
+        return ExportMetricsServiceResponse()
+
+
+def add_export_servicer(
+    servicer: LogService | TraceService | MetricsService, service_name: str, response_cls, server: grpc.aio.Server
+):
+    # no request_deserializer: Export receives the serialized request, so decoding can happen off the event loop
+    handler = grpc.unary_unary_rpc_method_handler(servicer.Export, response_serializer=response_cls.SerializeToString)
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(service_name, {"Export": handler}),))
+
+
 @asynccontextmanager
-async def db_setup():
-    conn_str = os.getenv("APP_DB", "postgres:postgres@localhost:5432/postgres")
-    sa_url = "postgresql+psycopg://" + conn_str
-    engine = create_async_engine(sa_url)
-    sessionmaker = async_sessionmaker(engine, class_=AsyncSession)
+async def db_setup(settings: ExporterSettings):
+    engine = create_async_engine(settings.get_db_url())
+    metadata = schema_metadata(settings.partitioned, settings.binary_ids)
 
     try:
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(metadata.create_all)
     except Exception:
-        print("Looks like the table already exists")
-    yield sessionmaker
-    await engine.dispose()
+        logger.warning("Looks like the table already exists")
+
+    maintenance = None
+    if settings.partitioned:
+        partitions = PartitionManager(
+            engine,
+            retention_days=settings.retention_days,
+            premake_days=settings.premake_days,
+            interval=settings.partition_interval,
+        )
+        await partitions.maintain()
+        maintenance = asyncio.create_task(partitions.run())
+    try:
+        yield engine
+    finally:
+        if maintenance is not None:
+            maintenance.cancel()
+            # a maintenance run may be in a transaction on the engine
+            with suppress(asyncio.CancelledError):
+                await maintenance
+        await engine.dispose()
+
+
+def buffer_setup(settings: ExporterSettings, engine: AsyncEngine) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        BulkWriter(
+            engine,
+            settings.write_mode,
+            metadata=schema_metadata(settings.partitioned, settings.binary_ids),
+            ignore_conflicts=settings.ignore_conflicts,
+        ),
+        max_rows=settings.buffer_max_rows,
+        flush_rows=settings.flush_rows,
+        flush_interval=settings.flush_interval,
+        flushers=settings.flushers,
+        dedup=DedupFilter(settings.dedup_cache) if settings.dedup_cache > 0 else None,
+        interned=InternCache(settings.intern_cache),
+    )
+
+
+@asynccontextmanager
+async def spool_setup(
+    settings: ExporterSettings, decoder: DecodePool, engine: AsyncEngine, sampler: TailSampler | None = None
+):
+    if not settings.spool_dir:
+        yield None
+        return
+    spool = Spool(
+        settings.spool_dir,
+        segment_bytes=settings.spool_segment_bytes,
+        max_bytes=settings.spool_max_bytes,
+        fsync=settings.spool_fsync,
+        fsync_interval=settings.spool_fsync_interval,
+    )
+    replayer = SpoolReplayer(
+        spool,
+        decoder,
+        BulkWriter(
+            engine,
+            settings.write_mode,
+            metadata=schema_metadata(settings.partitioned, settings.binary_ids),
+            ignore_conflicts=settings.ignore_conflicts,
+        ),
+        batch_bytes=settings.spool_replay_bytes,
+        dedup=DedupFilter(settings.dedup_cache) if settings.dedup_cache > 0 else None,
+        interned=InternCache(settings.intern_cache),
+        # requests are spooled before decoding, so tail sampling happens on replay
+        sampler=sampler,
+    )
+    async with spool:
+        logger.info("Spooling requests to %s, %d bytes to replay", settings.spool_dir, spool.depth)
+        replay = asyncio.create_task(replayer.run())
+        try:
+            yield spool
+        finally:
+            replay.cancel()
+            # the replayer may be reading segments or saving the cursor, wait before the spool closes
+            with suppress(asyncio.CancelledError):
+                await replay
+
+
+@asynccontextmanager
+async def sampler_setup(settings: ExporterSettings, buffer: WriteBehindBuffer):
+    if not settings.tail_sampling:
+        yield None
+        return
+    async with TailSampler(
+        buffer,
+        decision_wait=settings.sampling_decision_wait,
+        latency_threshold=settings.sampling_latency_threshold,
+        ratio=settings.sampling_ratio,
+        max_rows=settings.sampling_max_rows,
+    ) as sampler:
+        yield sampler
 
 
 async def serve():
-    async with db_setup() as sessionmaker:
-        server = grpc.aio.server()
-        add_TraceServiceServicer_to_server(TraceService(sessionmaker), server)
-        add_LogsServiceServicer_to_server(LogService(sessionmaker), server)
-        SERVICE_NAMES = (
-            TRACE_DESCRIPTOR.services_by_name["TraceService"].full_name,
-            LOGS_DESCRIPTOR.services_by_name["LogsService"].full_name,
-            reflection.SERVICE_NAME,
-        )
-        reflection.enable_server_reflection(SERVICE_NAMES, server)
+    settings = get_exporter_settings()
+    logging.basicConfig(level=settings.log_level)
+    meter_provider, scrape_reader = setup_telemetry(settings)
+    try:
+        with DecodePool(settings.decode_workers, settings.binary_ids) as decoder:
+            async with (
+                db_setup(settings) as engine,
+                buffer_setup(settings, engine) as buffer,
+                sampler_setup(settings, buffer) as sampler,
+                spool_setup(settings, decoder, engine, sampler) as spool,
+            ):
+                http_servers = []
+                if settings.http_port:
+                    http_servers.append(http_server(settings, decoder, buffer, spool, sampler))
+                if settings.metrics_port:
+                    http_servers.append(admin_server(settings, scrape_reader, SamplingProfiler()))
+                await run_server(settings, decoder, buffer, spool, http_servers, sampler)
+    finally:
+        meter_provider.shutdown()
+
 
-        port = os.getenv("APP_PORT", "4317")
+async def run_server(
+    settings: ExporterSettings,
+    decoder: DecodePool,
+    buffer: WriteBehindBuffer,
+    spool: Spool | None = None,
+    http_servers: Sequence[uvicorn.Server] = (),
+    sampler: TailSampler | None = None,
+):
+    trace_service_name = TRACE_DESCRIPTOR.services_by_name["TraceService"].full_name
+    logs_service_name = LOGS_DESCRIPTOR.services_by_name["LogsService"].full_name
+    metrics_service_name = METRICS_DESCRIPTOR.services_by_name["MetricsService"].full_name
 
-        server.add_insecure_port(f"[::]:{port}")
-        await server.start()
-        print(f"gRPC Server started on port {port}")
+    server = grpc.aio.server()
+    # with tail sampling enabled spans go through the sampler, which hands kept traces to the buffer
+    trace_service = TraceService(decoder, sampler or buffer, spool)
+    add_export_servicer(trace_service, trace_service_name, ExportTraceServiceResponse, server)
+    add_export_servicer(LogService(decoder, buffer, spool), logs_service_name, ExportLogsServiceResponse, server)
+    add_export_servicer(
+        MetricsService(decoder, buffer, spool), metrics_service_name, ExportMetricsServiceResponse, server
+    )
+    SERVICE_NAMES = (
+        trace_service_name,
+        logs_service_name,
+        metrics_service_name,
+        reflection.SERVICE_NAME,
+    )
+    reflection.enable_server_reflection(SERVICE_NAMES, server)
+
+    port = settings.port
+
+    server.add_insecure_port(f"[::]:{port}")
+    await server.start()
+    logger.info("gRPC Server started on port %s", port)
+    if not http_servers:
         await server.wait_for_termination()
+        return
+    # uvicorn handles the shutdown signals, once one server stops the others follow
+    tasks = [asyncio.create_task(http.serve()) for http in http_servers]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for http in http_servers:
+            http.should_exit = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await server.stop(grace=5)
 
 
 if __name__ == "__main__":
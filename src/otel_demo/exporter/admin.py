@@ -0,0 +1,55 @@
+import uvicorn
+from litestar import Litestar, MediaType, Response, get, post
+from litestar.datastructures import State
+from litestar.exceptions import ClientException
+from litestar.params import Parameter
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from .profiler import SamplingProfiler
+from .settings import ExporterSettings
+from .telemetry import render_prometheus
+
+PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@get("/metrics", sync_to_thread=False)
+def scrape(state: State) -> Response:
+    reader: InMemoryMetricReader | None = state.reader
+    data = reader.get_metrics_data() if reader is not None else None
+    return Response(content=render_prometheus(data), media_type=PROMETHEUS)
+
+
+@post("/debug/profile/start", status_code=200, sync_to_thread=False)
+def start_profile(state: State, interval: float = Parameter(default=0.005, gt=0, le=1)) -> dict:
+    profiler: SamplingProfiler = state.profiler
+    if profiler.running:
+        raise ClientException("Profiler already running")
+    profiler.start(interval)
+    return {"running": True, "interval": interval}
+
+
+@post("/debug/profile/stop", status_code=200, media_type=MediaType.TEXT, sync_to_thread=False)
+def stop_profile(state: State) -> str:
+    profiler: SamplingProfiler = state.profiler
+    if not profiler.running:
+        raise ClientException("Profiler is not running")
+    return profiler.stop()
+
+
+@get("/debug/profile", media_type=MediaType.TEXT, sync_to_thread=False)
+def profile_snapshot(state: State) -> str:
+    return state.profiler.folded()
+
+
+def create_admin_app(reader: InMemoryMetricReader | None, profiler: SamplingProfiler) -> Litestar:
+    return Litestar(
+        [scrape, start_profile, stop_profile, profile_snapshot],
+        state=State({"reader": reader, "profiler": profiler}),
+    )
+
+
+def admin_server(
+    settings: ExporterSettings, reader: InMemoryMetricReader | None, profiler: SamplingProfiler
+) -> uvicorn.Server:
+    app = create_admin_app(reader, profiler)
+    return uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=int(settings.metrics_port), access_log=False))
@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import UTC, date, datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    DateTime,
+    Integer,
+    MetaData,
+    Select,
+    String,
+    Table,
+    Text,
+    Uuid,
+    cast,
+    or_,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from .partitions import partition_day
+from .settings import get_exporter_settings
+from .tables import PARTITION_KEYS, BinaryId, schema_metadata
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional, `pip install otel-demo[archive]`
+    pa = ds = pq = None
+
+logger = logging.getLogger(__name__)
+
+# events first, they are selected through the spans they belong to
+ARCHIVED_TABLES = ("event", "span", "log")
+UNKNOWN_SERVICE = "unknown"
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Archiving needs pyarrow, install the `archive` extra: pip install otel-demo[archive]")
+
+
+def arrow_type(column_type) -> "pa.DataType":
+    # ids are hex in either schema mode, JSON and UUIDs are selected as text
+    match column_type:
+        case BinaryId() | String() | JSON() | Uuid():
+            return pa.string()
+        case DateTime():
+            return pa.timestamp("us")
+        case BigInteger():
+            return pa.int64()
+        case Integer():
+            return pa.int32()
+    raise TypeError(f"No archive type for {column_type!r}")
+
+
+def archived_column(table: Table, name: str):
+    column = table.c[name]
+    if isinstance(column.type, (JSON, Uuid)):
+        return cast(column, Text).label(name)
+    return column
+
+
+class Archiver:
+    """Moves `span`, `event` and `log` rows older than a cutoff out of Postgres into Parquet files.
+
+    Files are laid out as `<directory>/<table>/day=<YYYY-MM-DD>/service=<service.name>/part-<run>.parquet`, one row
+    group per fetched chunk, so `ArchiveReader` can skip days and services by path. Rows are read through server-side
+    cursors `chunk_rows` at a time and deleted in the same repeatable read transaction, rows written concurrently are
+    neither archived nor deleted. Partitions of the partitioned schema lying entirely before the cutoff are dropped
+    instead of deleted from. Should the commit fail after the files were written, the next run archives the rows again.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        directory: str,
+        metadata: MetaData,
+        partitioned: bool = False,
+        chunk_rows: int = 10_000,
+        compression: str = "zstd",
+    ):
+        require_pyarrow()
+        self.engine = engine
+        self.directory = Path(directory)
+        self.metadata = metadata
+        self.partitioned = partitioned
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+
+    def table(self, name: str) -> Table:
+        return self.metadata.tables[name]
+
+    def service_name(self):
+        resource = self.table("resource")
+        return resource.c.attributes["service.name"].astext
+
+    def statement(self, name: str, cutoff: datetime) -> Select:
+        table = self.table(name)
+        columns = [archived_column(table, column.name) for column in table.columns]
+        if name == "event":
+            # the service of an event is its span's, on the partitioned schema the span may already be gone
+            span, resource = self.table("span"), self.table("resource")
+            stmt = (
+                select(*columns, self.service_name())
+                .select_from(table)
+                .outerjoin(span, (span.c.trace_id == table.c.trace_id) & (span.c.span_id == table.c.span_id))
+                .outerjoin(resource, resource.c.resource_id == span.c.resource_id)
+            )
+            return stmt.where(self.event_condition(cutoff))
+        resource = self.table("resource")
+        time = table.c.start_time if name == "span" else table.c.time
+        return (
+            select(*columns, self.service_name())
+            .select_from(table)
+            .outerjoin(resource, resource.c.resource_id == table.c.resource_id)
+            .where(time < cutoff)
+        )
+
+    def event_condition(self, cutoff: datetime):
+        event, span = self.table("event"), self.table("span")
+        if self.partitioned:
+            return event.c.time < cutoff
+        # deleting a span cascades to all of its events, including ones after the cutoff
+        old_spans = select(span.c.trace_id, span.c.span_id).where(span.c.start_time < cutoff)
+        return or_(event.c.time < cutoff, tuple_(event.c.trace_id, event.c.span_id).in_(old_spans))
+
+    async def archive_table(self, conn: AsyncConnection, name: str, cutoff: datetime, run: str) -> int:
+        table = self.table(name)
+        names = [column.name for column in table.columns]
+        schema = pa.schema([(column.name, arrow_type(column.type)) for column in table.columns])
+        day_index = names.index("start_time" if name == "span" else "time")
+        writers: dict[tuple[date, str], tuple[pq.ParquetWriter, Path, Path]] = {}
+        rows_written = 0
+        try:
+            result = await conn.stream(self.statement(name, cutoff).execution_options(yield_per=self.chunk_rows))
+            async for rows in result.partitions():
+                groups: dict[tuple[date, str], list] = defaultdict(list)
+                for row in rows:
+                    groups[(row[day_index].date(), row[-1] or UNKNOWN_SERVICE)].append(row)
+                for key, group in groups.items():
+                    if key not in writers:
+                        writers[key] = self.open_writer(name, key, schema, run)
+                    values = list(zip(*group))
+                    arrays = [pa.array(values[index], type=field.type) for index, field in enumerate(schema)]
+                    writers[key][0].write_table(pa.Table.from_arrays(arrays, schema=schema))
+                rows_written += len(rows)
+        except BaseException:
+            for writer, partial_path, _ in writers.values():
+                writer.close()
+                partial_path.unlink(missing_ok=True)
+            raise
+        for writer, _, _ in writers.values():
+            writer.close()
+        # visible to readers only once complete, dot files are skipped by pyarrow datasets
+        for _, partial_path, path in writers.values():
+            os.replace(partial_path, path)
+        return rows_written
+
+    def open_writer(
+        self, name: str, key: tuple[date, str], schema: "pa.Schema", run: str
+    ) -> tuple["pq.ParquetWriter", Path, Path]:
+        day, service = key
+        folder = self.directory / name / f"day={day.isoformat()}" / f"service={quote(service, safe='')}"
+        folder.mkdir(parents=True, exist_ok=True)
+        partial_path = folder / f".part-{run}.parquet"
+        writer = pq.ParquetWriter(partial_path, schema, compression=self.compression)
+        return writer, partial_path, folder / f"part-{run}.parquet"
+
+    async def drop_partitions(self, conn: AsyncConnection, name: str, cutoff: datetime) -> list[str]:
+        result = await conn.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                "WHERE parent.relname = :table"
+            ),
+            {"table": name},
+        )
+        dropped = []
+        for (partition,) in result:
+            day = partition_day(partition)
+            if day is not None and day + timedelta(days=1) <= cutoff.date():
+                await conn.execute(text(f'ALTER TABLE "{name}" DETACH PARTITION "{partition}"'))
+                await conn.execute(text(f'DROP TABLE "{partition}"'))
+                dropped.append(partition)
+        return dropped
+
+    async def delete_rows(self, conn: AsyncConnection, cutoff: datetime):
+        if self.partitioned:
+            for name in PARTITION_KEYS:
+                dropped = await self.drop_partitions(conn, name, cutoff)
+                if dropped:
+                    logger.info("Dropped archived partitions: %s", ", ".join(dropped))
+        event, span, log = self.table("event"), self.table("span"), self.table("log")
+        # what's left before the cutoff: rows in the default partition, or all of them without partitioning
+        await conn.execute(event.delete().where(self.event_condition(cutoff)))
+        await conn.execute(span.delete().where(span.c.start_time < cutoff))
+        await conn.execute(log.delete().where(log.c.time < cutoff))
+
+    async def archive(self, cutoff: datetime) -> dict[str, int]:
+        """Archives and deletes rows before `cutoff` (UTC, naive like the columns), returns archived rows per table."""
+        run = f"{datetime.now(UTC):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        archived = {}
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+            async with conn.begin():
+                for name in ARCHIVED_TABLES:
+                    archived[name] = await self.archive_table(conn, name, cutoff, run)
+                await self.delete_rows(conn, cutoff)
+        return archived
+
+
+def trace_filter(trace_id: str) -> "ds.Expression":
+    return ds.field("trace_id") == trace_id
+
+
+class ArchiveReader:
+    """Scans the files written by `Archiver`, pruned by day and service before any file is opened."""
+
+    def __init__(self, directory: str):
+        require_pyarrow()
+        self.directory = Path(directory)
+        self.partitioning = ds.partitioning(pa.schema([("day", pa.date32()), ("service", pa.string())]), flavor="hive")
+
+    def dataset(self, table: str) -> "ds.Dataset | None":
+        path = self.directory / table
+        if not path.exists():
+            return None
+        return ds.dataset(path, format="parquet", partitioning=self.partitioning)
+
+    def scan(
+        self,
+        table: str,
+        start: date | None = None,
+        end: date | None = None,
+        service: str | None = None,
+        where: "ds.Expression | None" = None,
+        columns: list[str] | None = None,
+    ) -> "pa.Table":
+        """Rows of `table` from `start` to `end` (inclusive days), `day` and `service` come from the file paths."""
+        dataset = self.dataset(table)
+        if dataset is None:
+            return pa.table({})
+        conditions = [] if where is None else [where]
+        if start is not None:
+            conditions.append(ds.field("day") >= start)
+        if end is not None:
+            conditions.append(ds.field("day") <= end)
+        if service is not None:
+            conditions.append(ds.field("service") == service)
+        condition = None
+        for item in conditions:
+            condition = item if condition is None else condition & item
+        return dataset.to_table(columns=columns, filter=condition)
+
+    def trace(self, trace_id: str) -> tuple[list[dict], list[dict]]:
+        """Spans and events of one trace. Trace ids are random, so every file's id column is read."""
+        spans = self.scan("span", where=trace_filter(trace_id)).to_pylist()
+        events = self.scan("event", where=trace_filter(trace_id)).to_pylist() if spans else []
+        return spans, events
+
+
+async def run_archive():
+    settings = get_exporter_settings()
+    logging.basicConfig(level=settings.log_level)
+    if not settings.archive_dir:
+        raise SystemExit("APP_ARCHIVE_DIR is not set")
+    engine = create_async_engine(settings.get_db_url())
+    archiver = Archiver(
+        engine,
+        settings.archive_dir,
+        schema_metadata(settings.partitioned, settings.binary_ids),
+        partitioned=settings.partitioned,
+        chunk_rows=settings.archive_chunk_rows,
+    )
+    cutoff = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=settings.archive_after_days)
+    if settings.partitioned:
+        # whole days, so the archived partitions can be dropped instead of deleted from
+        cutoff = cutoff.replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        archived = await archiver.archive(cutoff)
+    finally:
+        await engine.dispose()
+    logger.info("Archived rows before %s: %s", cutoff.isoformat(), archived)
+
+
+def main():
+    asyncio.run(run_archive())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import base64
+import math
+from collections.abc import Callable, Iterable
+
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
+
+# oneof fields whose python value is already JSON-native
+SCALAR_FIELDS = frozenset(("string_value", "bool_value", "int_value"))
+
+_which = AnyValue.WhichOneof
+
+
+def _double(value: AnyValue) -> float | str:
+    number = value.double_value
+    # JSON has no NaN/Infinity, these become "nan", "inf" and "-inf"
+    return number if math.isfinite(number) else str(number)
+
+
+def _bytes(value: AnyValue) -> str:
+    # base64 like the OTLP JSON encoding
+    return base64.b64encode(value.bytes_value).decode()
+
+
+def _array(value: AnyValue) -> list:
+    return [decode_anyvalue(item) for item in value.array_value.values]
+
+
+def _kvlist(value: AnyValue) -> dict:
+    return decode_attributes(value.kvlist_value.values)
+
+
+# oneof field (None when unset) -> converter for everything not in SCALAR_FIELDS
+DECODERS: dict[str | None, Callable[[AnyValue], object]] = {
+    "double_value": _double,
+    "bytes_value": _bytes,
+    "array_value": _array,
+    "kvlist_value": _kvlist,
+    None: lambda value: None,
+}
+
+
+def decode_anyvalue(value: AnyValue):
+    """AnyValue as a JSON-native value, arrays and kvlists recursively."""
+    field = _which(value, "value")
+    if field in SCALAR_FIELDS:
+        return getattr(value, field)
+    return DECODERS[field](value)
+
+
+def decode_attributes(attributes: Iterable[KeyValue]) -> dict:
+    decoded = {}
+    for attribute in attributes:
+        # decode_anyvalue inlined, this runs for every attribute of every span, event, log and data point
+        value = attribute.value
+        field = _which(value, "value")
+        if field in SCALAR_FIELDS:
+            decoded[attribute.key] = getattr(value, field)
+        else:
+            decoded[attribute.key] = DECODERS[field](value)
+    return decoded
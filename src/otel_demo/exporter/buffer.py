@@ -0,0 +1,153 @@
+import asyncio
+import logging
+
+from opentelemetry import metrics
+
+from .decode import RowBatch
+from .dedup import DedupFilter
+from .ingest import BulkWriter
+from .intern import InternCache
+from .telemetry import dropped_rows
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    """Coalesces decoded rows from many Export calls and writes them from background flusher tasks.
+
+    A flush starts once `flush_rows` rows are pending or the oldest pending row is `flush_interval` seconds old.
+    Rows are counted until their transaction commits, so `max_rows` bounds memory including in-flight flushes.
+    """
+
+    def __init__(
+        self,
+        writer: BulkWriter,
+        max_rows: int = 200_000,
+        flush_rows: int = 10_000,
+        flush_interval: float = 1.0,
+        flushers: int = 2,
+        retry_delay: float = 1.0,
+        max_retries: int = 5,
+        dedup: DedupFilter | None = None,
+        interned: InternCache | None = None,
+    ):
+        self.writer = writer
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.flushers = flushers
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.dedup = dedup
+        self.interned = interned
+
+        self.pending = RowBatch()
+        self.pending_rows = 0
+        self.in_flight_rows = 0
+        self.oldest: float | None = None
+        self.closing = False
+        self.wakeup = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+
+        metrics.get_meter(__name__).create_observable_gauge(
+            "exporter.buffer.depth", [self.observe_depth], unit="{row}", description="Rows pending or being flushed"
+        )
+
+    def observe_depth(self, options):
+        yield metrics.Observation(self.depth)
+
+    @property
+    def depth(self) -> int:
+        return self.pending_rows + self.in_flight_rows
+
+    def put(self, batch: RowBatch):
+        keys, interned_keys = [], []
+        if self.dedup is not None:
+            batch, keys = self.dedup.filter(batch)
+        if self.interned is not None:
+            batch, interned_keys = self.interned.filter(batch)
+        rows = batch.row_count()
+        if not rows:
+            return
+        if self.closing or self.depth + rows > self.max_rows:
+            raise BufferFull(f"write buffer is full ({self.depth}/{self.max_rows} rows)")
+        if self.dedup is not None:
+            self.dedup.remember(keys)
+        if self.interned is not None:
+            self.interned.remember(interned_keys)
+        self.pending.merge(batch)
+        self.pending_rows += rows
+        if self.oldest is None:
+            self.oldest = asyncio.get_running_loop().time()
+            # idle flushers wait without a timeout, wake them to start the flush_interval clock
+            self.wakeup.set()
+        elif self.pending_rows >= self.flush_rows:
+            self.wakeup.set()
+
+    def take(self) -> RowBatch:
+        batch = self.pending
+        self.in_flight_rows += self.pending_rows
+        self.pending = RowBatch()
+        self.pending_rows = 0
+        self.oldest = None
+        return batch
+
+    async def wait_for_batch(self):
+        loop = asyncio.get_running_loop()
+        while self.pending_rows < self.flush_rows and not self.closing:
+            timeout = None
+            if self.oldest is not None:
+                timeout = self.oldest + self.flush_interval - loop.time()
+                if timeout <= 0:
+                    return
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+
+    async def flush(self, batch: RowBatch):
+        rows = batch.row_count()
+        try:
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    await self.writer.write(batch)
+                    return
+                except Exception:
+                    logger.exception("Flush of %d rows failed (attempt %d/%d)", rows, attempt, self.max_retries)
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(self.retry_delay * attempt)
+            logger.error("Dropping %d rows after %d failed flushes", rows, self.max_retries)
+            dropped_rows.add(rows)
+            if self.interned is not None:
+                # the next batch referencing these resources, scopes and series has to carry them again
+                self.interned.forget(batch)
+        finally:
+            self.in_flight_rows -= rows
+
+    async def run_flusher(self):
+        while not self.closing or self.pending_rows:
+            await self.wait_for_batch()
+            if self.pending_rows:
+                await self.flush(self.take())
+
+    async def start(self):
+        self.closing = False
+        self.tasks = [asyncio.create_task(self.run_flusher()) for _ in range(self.flushers)]
+
+    async def stop(self):
+        self.closing = True
+        self.wakeup.set()
+        await asyncio.gather(*self.tasks)
+        self.tasks = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceRequest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.common.v1.common_pb2 import InstrumentationScope
+from opentelemetry.proto.resource.v1.resource_pb2 import Resource
+
+from .attributes import decode_anyvalue, decode_attributes
+
+RESOURCE_COLUMNS = ("resource_id", "attributes")
+SCOPE_COLUMNS = ("scope_id", "name", "version", "attributes")
+SPAN_COLUMNS = (
+    "trace_id",
+    "span_id",
+    "parent_span_id",
+    "start_time",
+    "end_time",
+    "name",
+    "status",
+    "attributes",
+    "state",
+    "resource_id",
+    "scope_id",
+)
+EVENT_COLUMNS = ("trace_id", "span_id", "event_no", "time", "name", "attributes")
+LOG_COLUMNS = ("trace_id", "span_id", "log_id", "severity", "time", "attributes", "body", "resource_id", "scope_id")
+METRIC_SERIES_COLUMNS = (
+    "series_id",
+    "name",
+    "kind",
+    "unit",
+    "temporality",
+    "monotonic",
+    "resource_id",
+    "scope_id",
+    "attributes",
+)
+METRIC_POINT_COLUMNS = ("series_id", "time", "value")
+METRIC_HISTOGRAM_COLUMNS = ("series_id", "time", "count", "sum", "bounds", "counts")
+
+COLUMNS: dict[str, tuple[str, ...]] = {
+    "resource": RESOURCE_COLUMNS,
+    "scope": SCOPE_COLUMNS,
+    "span": SPAN_COLUMNS,
+    "event": EVENT_COLUMNS,
+    "log": LOG_COLUMNS,
+    "metric_series": METRIC_SERIES_COLUMNS,
+    "metric_point": METRIC_POINT_COLUMNS,
+    "metric_histogram": METRIC_HISTOGRAM_COLUMNS,
+}
+
+
+class RowBatch(dict[str, list[tuple]]):
+    """Decoded rows ready for insertion, keyed by table name. Row tuples follow `COLUMNS[table]`.
+
+    Timestamps stay integer nanoseconds since the Unix epoch, the writer converts them.
+
+    Resources and scopes are content-addressed: their rows carry a hash of their contents as id, and span, log and
+    metric rows reference that id instead of repeating the attributes.
+    """
+
+    def add(self, table: str, row: tuple):
+        self.setdefault(table, []).append(row)
+
+    def merge(self, other: "RowBatch"):
+        for table, rows in other.items():
+            self.setdefault(table, []).extend(rows)
+
+    def row_count(self) -> int:
+        return sum(len(rows) for rows in self.values())
+
+    def count(self, table: str) -> int:
+        return len(self.get(table, ()))
+
+    def add_resource(self, resource: Resource) -> int:
+        attributes = decode_attributes(resource.attributes)
+        resource_id = content_id(canonical_json(attributes))
+        self.add("resource", (resource_id, attributes))
+        return resource_id
+
+    def add_scope(self, scope: InstrumentationScope) -> int:
+        attributes = decode_attributes(scope.attributes)
+        scope_id = content_id(scope.name, scope.version, canonical_json(attributes))
+        self.add("scope", (scope_id, scope.name, scope.version, attributes))
+        return scope_id
+
+
+def bytes_to_hex_str(b: bytes) -> str:
+    return b.hex()
+
+
+def canonical_json(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def content_id(*parts: str) -> int:
+    digest = hashlib.blake2b("\x1f".join(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+# naive UTC like the columns, an aware value would be converted through the session TimeZone
+EPOCH = datetime(1970, 1, 1)
+
+
+def nanos_to_datetime(ns: int) -> datetime:
+    # integer math, ns / 1e9 as a float is only accurate to about a quarter microsecond
+    return EPOCH + timedelta(microseconds=(ns + 500) // 1000)
+
+
+def id_converter(binary_ids: bool) -> Callable[[bytes], str | bytes]:
+    # the binary id schema stores the protobuf bytes as they are, bytes() of bytes is the same object
+    return bytes if binary_ids else bytes_to_hex_str
+
+
+def decode_traces(request: ExportTraceServiceRequest, binary_ids: bool = False) -> RowBatch:
+    to_id = id_converter(binary_ids)
+    batch = RowBatch(span=[], event=[])
+    spans = batch["span"]
+    events = batch["event"]
+    for res_span in request.resource_spans:
+        resource_id = batch.add_resource(res_span.resource)
+        for scp_span in res_span.scope_spans:
+            scope_id = batch.add_scope(scp_span.scope)
+            for span in scp_span.spans:
+                trace_id = to_id(span.trace_id)
+                span_id = to_id(span.span_id)
+                spans.append(
+                    (
+                        trace_id,
+                        span_id,
+                        to_id(span.parent_span_id) if span.parent_span_id else None,
+                        span.start_time_unix_nano,
+                        span.end_time_unix_nano,
+                        span.name,
+                        span.status.code,
+                        decode_attributes(span.attributes),
+                        span.trace_state,
+                        resource_id,
+                        scope_id,
+                    )
+                )
+                for event_no, event in enumerate(span.events):
+                    events.append(
+                        (
+                            trace_id,
+                            span_id,
+                            event_no,
+                            event.time_unix_nano,
+                            event.name,
+                            decode_attributes(event.attributes),
+                        )
+                    )
+    return batch
+
+
+def decode_logs(request: ExportLogsServiceRequest, binary_ids: bool = False) -> RowBatch:
+    batch = RowBatch(log=[])
+    logs = batch["log"]
+    for res_log in request.resource_logs:
+        resource_id = batch.add_resource(res_log.resource)
+        for scp_log in res_log.scope_logs:
+            scope_id = batch.add_scope(scp_log.scope)
+            for log_record in scp_log.log_records:
+                if not (log_record.trace_id and log_record.span_id):
+                    continue
+                if binary_ids:
+                    trace_id, span_id = log_record.trace_id, log_record.span_id
+                else:
+                    trace_id, span_id = bytes_to_hex_str(log_record.trace_id), bytes_to_hex_str(log_record.span_id)
+                # digest of the whole record: the same for retried records, distinct for different records of a span
+                # within one timestamp, which the microsecond `time` column cannot tell apart
+                digest = hashlib.sha1(log_record.SerializeToString(deterministic=True)).digest()
+                attributes = {**decode_attributes(log_record.attributes), "exp_identifier": digest.hex()}
+                body = decode_anyvalue(log_record.body)
+                if body is not None and not isinstance(body, str):
+                    # structured bodies are stored as their JSON text
+                    body = json.dumps(body)
+                logs.append(
+                    (
+                        trace_id,
+                        span_id,
+                        uuid.UUID(bytes=digest[:16]),
+                        log_record.severity_text,
+                        log_record.time_unix_nano,
+                        attributes,
+                        body,
+                        resource_id,
+                        scope_id,
+                    )
+                )
+    return batch
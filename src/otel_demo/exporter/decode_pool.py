@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import json
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from google.protobuf import json_format
+from google.protobuf.message import Message
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceRequest
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceRequest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+
+from .decode import RowBatch, decode_logs, decode_traces
+from .metrics import decode_metrics
+from .telemetry import decode_duration, request_rows, timed
+
+
+def decode_traces_bytes(data: bytes, binary_ids: bool = False) -> RowBatch:
+    return decode_traces(ExportTraceServiceRequest.FromString(data), binary_ids)
+
+
+def decode_logs_bytes(data: bytes, binary_ids: bool = False) -> RowBatch:
+    return decode_logs(ExportLogsServiceRequest.FromString(data), binary_ids)
+
+
+def decode_metrics_bytes(data: bytes) -> RowBatch:
+    return decode_metrics(ExportMetricsServiceRequest.FromString(data))
+
+
+# OTLP/JSON encodes trace and span ids as hex, protobuf JSON expects base64 for bytes fields
+ID_FIELDS = frozenset(("traceId", "spanId", "parentSpanId", "trace_id", "span_id", "parent_span_id"))
+
+
+def hex_ids_to_base64(value):
+    if isinstance(value, dict):
+        return {
+            key: base64.b64encode(bytes.fromhex(item)).decode()
+            if key in ID_FIELDS and isinstance(item, str)
+            else hex_ids_to_base64(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [hex_ids_to_base64(item) for item in value]
+    return value
+
+
+def parse_json(message: Message, data: bytes) -> Message:
+    return json_format.ParseDict(hex_ids_to_base64(json.loads(data)), message, ignore_unknown_fields=True)
+
+
+def decode_traces_json(data: bytes, binary_ids: bool = False) -> RowBatch:
+    return decode_traces(parse_json(ExportTraceServiceRequest(), data), binary_ids)
+
+
+def decode_logs_json(data: bytes, binary_ids: bool = False) -> RowBatch:
+    return decode_logs(parse_json(ExportLogsServiceRequest(), data), binary_ids)
+
+
+def decode_metrics_json(data: bytes) -> RowBatch:
+    return decode_metrics(parse_json(ExportMetricsServiceRequest(), data))
+
+
+def worker_init():
+    # Ctrl+C is handled by the server process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class DecodePool:
+    """Decodes serialized OTLP requests into row batches, in worker processes when `workers` > 0.
+
+    With `binary_ids` trace and span ids are left as bytes for the binary id schema.
+    """
+
+    def __init__(self, workers: int = 0, binary_ids: bool = False):
+        self.workers = workers
+        self.binary_ids = binary_ids
+        self.executor: ProcessPoolExecutor | None = None
+        if workers > 0:
+            # grpc runs its own threads, forking them is unsafe
+            self.executor = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"), initializer=worker_init
+            )
+
+    async def run(self, signal: str, fn, data: bytes) -> RowBatch:
+        # measured from the event loop, so time spent waiting for a free worker is included
+        with timed(decode_duration, {"signal": signal}):
+            if self.executor is None:
+                batch = fn(data)
+            else:
+                batch = await asyncio.get_running_loop().run_in_executor(self.executor, fn, data)
+        request_rows.record(batch.row_count(), {"signal": signal})
+        return batch
+
+    async def traces(self, data: bytes, as_json: bool = False) -> RowBatch:
+        fn = decode_traces_json if as_json else decode_traces_bytes
+        return await self.run("traces", partial(fn, binary_ids=self.binary_ids), data)
+
+    async def logs(self, data: bytes, as_json: bool = False) -> RowBatch:
+        fn = decode_logs_json if as_json else decode_logs_bytes
+        return await self.run("logs", partial(fn, binary_ids=self.binary_ids), data)
+
+    async def metrics(self, data: bytes, as_json: bool = False) -> RowBatch:
+        return await self.run("metrics", decode_metrics_json if as_json else decode_metrics_bytes, data)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+from .decode import EVENT_COLUMNS, LOG_COLUMNS, SPAN_COLUMNS, RowBatch
+
+_SPAN_TRACE = SPAN_COLUMNS.index("trace_id")
+_SPAN_SPAN = SPAN_COLUMNS.index("span_id")
+_EVENT_TRACE = EVENT_COLUMNS.index("trace_id")
+_EVENT_SPAN = EVENT_COLUMNS.index("span_id")
+_EVENT_NO = EVENT_COLUMNS.index("event_no")
+_LOG_ATTRIBUTES = LOG_COLUMNS.index("attributes")
+
+
+def span_key(row: tuple) -> Hashable:
+    return ("span", row[_SPAN_TRACE], row[_SPAN_SPAN])
+
+
+def log_key(row: tuple) -> Hashable:
+    return ("log", row[_LOG_ATTRIBUTES]["exp_identifier"])
+
+
+KEY_FUNCTIONS: dict[str, Callable[[tuple], Hashable]] = {
+    "span": span_key,
+    "log": log_key,
+}
+
+
+def filter_events(rows: list[tuple], dropped_spans: set[tuple], repeated_spans: set[tuple]) -> list[tuple]:
+    # a repeated span brings its events again, only the first copy of each is kept
+    kept = []
+    seen: set[tuple] = set()
+    for row in rows:
+        span = (row[_EVENT_TRACE], row[_EVENT_SPAN])
+        if span in dropped_spans:
+            continue
+        if span in repeated_spans:
+            key = (*span, row[_EVENT_NO])
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(row)
+    return kept
+
+
+class RecentKeys:
+    """Bounded LRU set of row keys that were recently accepted."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.keys: OrderedDict[Hashable, None] = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: Hashable):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+        if len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
+
+
+class DedupFilter:
+    """Drops spans and logs that were already accepted or repeat within the batch, together with their events.
+
+    `filter` does not record anything; call `remember` once the filtered batch was actually accepted,
+    otherwise a rejected batch would be treated as a duplicate when the collector retries it.
+    """
+
+    def __init__(self, capacity: int):
+        self.recent = RecentKeys(capacity)
+
+    def filter(self, batch: RowBatch) -> tuple[RowBatch, list[Hashable]]:
+        fresh = RowBatch()
+        accepted: list[Hashable] = []
+        dropped_spans: set[tuple] = set()
+        repeated_spans: set[tuple] = set()
+        for table, rows in batch.items():
+            key_fn = KEY_FUNCTIONS.get(table)
+            if key_fn is None:
+                continue
+            seen: set[Hashable] = set()
+            kept = []
+            for row in rows:
+                key = key_fn(row)
+                if key in seen:
+                    if table == "span":
+                        repeated_spans.add((row[_SPAN_TRACE], row[_SPAN_SPAN]))
+                    continue
+                if key in self.recent:
+                    if table == "span":
+                        dropped_spans.add((row[_SPAN_TRACE], row[_SPAN_SPAN]))
+                    continue
+                seen.add(key)
+                kept.append(row)
+            fresh[table] = kept
+            accepted.extend(seen)
+        for table, rows in batch.items():
+            if table == "event":
+                fresh[table] = filter_events(rows, dropped_spans, repeated_spans)
+            elif table not in KEY_FUNCTIONS:
+                fresh[table] = rows
+        return fresh, accepted
+
+    def remember(self, keys: list[Hashable]):
+        for key in keys:
+            self.recent.add(key)
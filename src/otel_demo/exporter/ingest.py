@@ -0,0 +1,168 @@
+import struct
+from functools import cache
+
+from psycopg import AsyncConnection, AsyncCursor, postgres, sql
+from psycopg.adapt import Dumper
+from psycopg.pq import Format
+from sqlalchemy import JSON, BigInteger, Boolean, DateTime, Float, Integer, MetaData, String, Table, Uuid
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncConnection as SAAsyncConnection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .decode import COLUMNS, RowBatch, nanos_to_datetime
+from .intern import INTERNED_TABLES
+from .settings import WriteMode
+from .tables import Base, BinaryId
+from .telemetry import timed, transaction_duration, written_rows
+
+# Postgres counts timestamps in microseconds from 2000-01-01
+PG_EPOCH_NS = 946_684_800 * 10**9
+_pack_int8 = struct.Struct(">q").pack
+
+# column type -> Postgres type the COPY values are dumped as, subclasses first
+COPY_TYPES = (
+    (BinaryId, "bytea"),
+    (DateTime, "timestamp"),
+    (JSON, "jsonb"),
+    (BigInteger, "int8"),
+    (Integer, "int4"),
+    (Float, "float8"),
+    (Boolean, "bool"),
+    (Uuid, "uuid"),
+    (String, "text"),
+)
+
+
+class NanosTimestampBinaryDumper(Dumper):
+    """Integer nanoseconds since the Unix epoch as binary `timestamp`, rounded to microseconds like Postgres does.
+
+    Skips the datetime a row would otherwise carry, and its float conversion loses sub-microsecond digits.
+    """
+
+    format = Format.BINARY
+    oid = postgres.types["timestamp"].oid
+
+    def dump(self, obj: int) -> bytes:
+        return _pack_int8((obj - PG_EPOCH_NS + 500) // 1000)
+
+
+def copy_statement(table: str, columns: tuple[str, ...]) -> sql.Composed:
+    return sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+        sql.Identifier(table),
+        sql.SQL(", ").join(map(sql.Identifier, columns)),
+    )
+
+
+def copy_type(column_type) -> str:
+    if isinstance(column_type, ARRAY):
+        return f"{copy_type(column_type.item_type)}[]"
+    for sa_type, name in COPY_TYPES:
+        if isinstance(column_type, sa_type):
+            return name
+    raise TypeError(f"No COPY type for {column_type!r}")
+
+
+@cache
+def copy_types(table: Table, columns: tuple[str, ...]) -> list[str]:
+    return [copy_type(table.c[column].type) for column in columns]
+
+
+@cache
+def timestamp_columns(table: Table) -> list[str]:
+    return [column.name for column in table.columns if isinstance(column.type, DateTime)]
+
+
+def stage_table(table: str) -> str:
+    return f"_stage_{table}"
+
+
+def stage_statements(table: str, columns: tuple[str, ...]) -> tuple[sql.Composed, sql.Composed]:
+    # COPY cannot skip conflicting rows, so it lands in a per-connection temp table first
+    stage = sql.Identifier(stage_table(table))
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    create = sql.SQL("CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {}) ON COMMIT DELETE ROWS").format(
+        stage, sql.Identifier(table)
+    )
+    merge = sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT DO NOTHING").format(
+        sql.Identifier(table), column_list, column_list, stage
+    )
+    return create, merge
+
+
+class BulkWriter:
+    """Writes a `RowBatch` in a single transaction, either through COPY or multi-row core inserts.
+
+    With `ignore_conflicts` rows whose primary key already exists are skipped, so a retried batch is a no-op
+    instead of aborting the whole transaction.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        mode: WriteMode = WriteMode.COPY,
+        metadata: MetaData = Base.metadata,
+        ignore_conflicts: bool = True,
+    ):
+        self.engine = engine
+        self.mode = mode
+        self.metadata = metadata
+        self.ignore_conflicts = ignore_conflicts
+
+    def skips_conflicts(self, table: str) -> bool:
+        # interned rows arrive again whenever the cache forgets them, so their conflicts are always skipped
+        return self.ignore_conflicts or table in INTERNED_TABLES
+
+    def ordered_tables(self, batch: RowBatch) -> list[str]:
+        # parents first, so foreign keys (event -> span) are satisfied inside the transaction
+        return [table.name for table in self.metadata.sorted_tables if batch.get(table.name)]
+
+    async def write(self, batch: RowBatch):
+        tables = self.ordered_tables(batch)
+        if not tables:
+            return
+        with timed(transaction_duration, {"mode": self.mode, "outcome": "error"}) as attributes:
+            async with self.engine.begin() as conn:
+                if self.mode == WriteMode.COPY:
+                    await self.copy_rows(conn, batch, tables)
+                else:
+                    await self.insert_rows(conn, batch, tables)
+            attributes["outcome"] = "ok"
+        for table in tables:
+            written_rows.add(len(batch[table]), {"table": table})
+
+    async def copy_rows(self, conn: SAAsyncConnection, batch: RowBatch, tables: list[str]):
+        raw_conn = await conn.get_raw_connection()
+        driver_conn: AsyncConnection = raw_conn.driver_connection  # type: ignore
+        async with driver_conn.cursor() as cur:
+            # binary COPY with the column types set picks dumpers by Postgres type, timestamps arrive as nanoseconds
+            cur.adapters.register_dumper(None, NanosTimestampBinaryDumper)
+            for table in tables:
+                columns = COLUMNS[table]
+                types = copy_types(self.metadata.tables[table], columns)
+                if not self.skips_conflicts(table):
+                    await self.copy_table(cur, table, columns, types, batch[table])
+                    continue
+                create, merge = stage_statements(table, columns)
+                await cur.execute(create)
+                await self.copy_table(cur, stage_table(table), columns, types, batch[table])
+                await cur.execute(merge)
+
+    async def copy_table(
+        self, cur: AsyncCursor, table: str, columns: tuple[str, ...], types: list[str], rows: list[tuple]
+    ):
+        async with cur.copy(copy_statement(table, columns)) as copy:
+            copy.set_types(types)
+            for row in rows:
+                await copy.write_row(row)
+
+    async def insert_rows(self, conn: SAAsyncConnection, batch: RowBatch, tables: list[str]):
+        for table in tables:
+            columns = COLUMNS[table]
+            stmt = insert(self.metadata.tables[table])
+            if self.skips_conflicts(table):
+                stmt = stmt.on_conflict_do_nothing()
+            params = [dict(zip(columns, row)) for row in batch[table]]
+            for column in timestamp_columns(self.metadata.tables[table]):
+                for values in params:
+                    values[column] = nanos_to_datetime(values[column])
+            await conn.execute(stmt, params)
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+from .decode import RowBatch
+
+# content-addressed tables, the first column of every row is the hash of its contents
+INTERNED_TABLES = ("resource", "scope", "metric_series")
+
+InternKey = tuple[str, int]
+
+
+class InternCache:
+    """Bounded LRU of content ids already handed to the writer, so repeat batches skip the interned tables.
+
+    Like `DedupFilter`, `filter` only drops rows and `remember` records the ids once the batch was accepted.
+    A batch that is dropped instead of written must be passed to `forget`, later batches skip its rows otherwise.
+    """
+
+    def __init__(self, capacity: int = 100_000):
+        self.capacity = capacity
+        self.known: OrderedDict[InternKey, None] = OrderedDict()
+
+    def filter(self, batch: RowBatch) -> tuple[RowBatch, list[InternKey]]:
+        fresh = RowBatch(batch)
+        new_keys: list[InternKey] = []
+        for table in INTERNED_TABLES:
+            rows = batch.get(table)
+            if not rows:
+                continue
+            new_rows = []
+            seen: set[InternKey] = set()
+            for row in rows:
+                key = (table, row[0])
+                if key in seen:
+                    continue
+                seen.add(key)
+                if key in self.known:
+                    self.known.move_to_end(key)
+                else:
+                    new_rows.append(row)
+                    new_keys.append(key)
+            fresh[table] = new_rows
+        return fresh, new_keys
+
+    def remember(self, keys: list[InternKey]):
+        for key in keys:
+            self.known[key] = None
+            if len(self.known) > self.capacity:
+                self.known.popitem(last=False)
+
+    def forget(self, batch: RowBatch):
+        for table in INTERNED_TABLES:
+            for row in batch.get(table) or ():
+                self.known.pop((table, row[0]), None)
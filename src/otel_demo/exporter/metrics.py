@@ -0,0 +1,81 @@
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceRequest
+from opentelemetry.proto.metrics.v1.metrics_pb2 import AggregationTemporality
+
+from .attributes import decode_attributes
+from .decode import RowBatch, canonical_json, content_id
+
+GAUGE = "gauge"
+SUM = "sum"
+HISTOGRAM = "histogram"
+
+
+def series_id(resource_id: int, scope_id: int, name: str, kind: str, unit: str, attributes: dict) -> int:
+    return content_id(str(resource_id), str(scope_id), name, kind, unit, canonical_json(attributes))
+
+
+def number_value(point) -> float:
+    if point.WhichOneof("value") == "as_int":
+        return float(point.as_int)
+    return point.as_double
+
+
+def decode_metrics(request: ExportMetricsServiceRequest) -> RowBatch:
+    """Decodes gauges, sums and histograms into narrow point rows referencing content-hashed series.
+
+    Every series a point references is emitted once per request; `InternCache` drops the ones already stored.
+    Exponential histograms and summaries are not stored.
+    """
+    batch = RowBatch(metric_series=[], metric_point=[], metric_histogram=[])
+    series_rows: dict[int, tuple] = {}
+    points = batch["metric_point"]
+    histograms = batch["metric_histogram"]
+    for res_metric in request.resource_metrics:
+        resource_id = batch.add_resource(res_metric.resource)
+        for scp_metric in res_metric.scope_metrics:
+            scope_id = batch.add_scope(scp_metric.scope)
+            for metric in scp_metric.metrics:
+                data = metric.WhichOneof("data")
+                if data == GAUGE:
+                    temporality, monotonic = AggregationTemporality.AGGREGATION_TEMPORALITY_UNSPECIFIED, False
+                    data_points = metric.gauge.data_points
+                elif data == SUM:
+                    temporality, monotonic = metric.sum.aggregation_temporality, metric.sum.is_monotonic
+                    data_points = metric.sum.data_points
+                elif data == HISTOGRAM:
+                    temporality, monotonic = metric.histogram.aggregation_temporality, False
+                    data_points = metric.histogram.data_points
+                else:
+                    continue
+                for point in data_points:
+                    attributes = decode_attributes(point.attributes)
+                    sid = series_id(resource_id, scope_id, metric.name, data, metric.unit, attributes)
+                    if sid not in series_rows:
+                        series_rows[sid] = (
+                            sid,
+                            metric.name,
+                            data,
+                            metric.unit,
+                            temporality,
+                            monotonic,
+                            resource_id,
+                            scope_id,
+                            attributes,
+                        )
+                    time = point.time_unix_nano
+                    if data == HISTOGRAM:
+                        histograms.append(histogram_row(sid, time, point))
+                    else:
+                        points.append((sid, time, number_value(point)))
+    batch["metric_series"] = list(series_rows.values())
+    return batch
+
+
+def histogram_row(sid: int, time: int, point) -> tuple:
+    return (
+        sid,
+        time,
+        point.count,
+        point.sum if point.HasField("sum") else None,
+        list(point.explicit_bounds),
+        list(point.bucket_counts),
+    )
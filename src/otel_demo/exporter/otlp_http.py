@@ -0,0 +1,136 @@
+import logging
+import zlib
+
+import uvicorn
+from google.protobuf.json_format import ParseError
+from google.protobuf.message import DecodeError, Message
+from litestar import Litestar, Request, Response, post
+from litestar.datastructures import State
+from litestar.exceptions import ClientException, HTTPException, ServiceUnavailableException
+from litestar.status_codes import HTTP_413_REQUEST_ENTITY_TOO_LARGE, HTTP_415_UNSUPPORTED_MEDIA_TYPE
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import ExportLogsServiceResponse
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceResponse
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceResponse
+
+from .buffer import BufferFull, WriteBehindBuffer
+from .decode_pool import DecodePool
+from .sampling import TailSampler
+from .settings import ExporterSettings
+from .spool import Spool, SpoolFull
+from .telemetry import record_request
+
+PROTOBUF = "application/x-protobuf"
+JSON = "application/json"
+
+logger = logging.getLogger(__name__)
+
+
+async def read_body(request: Request, max_size: int) -> bytes:
+    # inflate while the body streams in, so an oversized gzip payload is rejected before it is fully expanded
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding == "gzip":
+        inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    elif encoding == "identity":
+        inflater = None
+    else:
+        raise HTTPException(status_code=HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Unsupported encoding: {encoding}")
+    body = bytearray()
+    try:
+        async for chunk in request.stream():
+            if inflater is not None:
+                # stops one byte past the limit, the rest of the chunk is never inflated
+                chunk = inflater.decompress(chunk, max_size - len(body) + 1)
+            body += chunk
+            if len(body) > max_size:
+                raise HTTPException(status_code=HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Request body too large")
+    except zlib.error as e:
+        raise ClientException(f"Malformed gzip body: {e}") from e
+    if inflater is not None and not inflater.eof:
+        raise ClientException("Truncated gzip body")
+    return bytes(body)
+
+
+def content_format(request: Request) -> bool:
+    media_type = request.headers.get("content-type", PROTOBUF).split(";")[0].strip().lower()
+    if media_type == JSON:
+        return True
+    if media_type == PROTOBUF:
+        return False
+    raise HTTPException(status_code=HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Unsupported content type: {media_type}")
+
+
+def export_response(response: Message, as_json: bool) -> Response:
+    if as_json:
+        return Response(content=b"{}", media_type=JSON)
+    return Response(content=response.SerializeToString(), media_type=PROTOBUF)
+
+
+async def export(request: Request, state: State, kind: str, response: Message) -> Response:
+    as_json = content_format(request)
+    data = await read_body(request, state.max_body_size)
+    outcome = "accepted"
+    try:
+        if state.spool is not None:
+            await state.spool.append(kind, data, as_json)
+        else:
+            batch = await getattr(state.decoder, kind)(data, as_json)
+            state.buffers.get(kind, state.buffer).put(batch)
+            logger.debug("%s: %d rows", kind, batch.row_count())
+    except (DecodeError, ParseError, ValueError) as e:
+        outcome = "invalid"
+        raise ClientException(f"Malformed request: {e}") from e
+    except (BufferFull, SpoolFull) as e:
+        outcome = "rejected"
+        # OTLP/HTTP clients retry 503 responses, honouring Retry-After
+        raise ServiceUnavailableException(str(e), headers={"Retry-After": "1"}) from e
+    finally:
+        record_request(kind, "http", len(data), outcome)
+    return export_response(response, as_json)
+
+
+@post("/v1/traces", status_code=200)
+async def export_traces(request: Request, state: State) -> Response:
+    return await export(request, state, "traces", ExportTraceServiceResponse())
+
+
+@post("/v1/logs", status_code=200)
+async def export_logs(request: Request, state: State) -> Response:
+    return await export(request, state, "logs", ExportLogsServiceResponse())
+
+
+@post("/v1/metrics", status_code=200)
+async def export_metrics(request: Request, state: State) -> Response:
+    return await export(request, state, "metrics", ExportMetricsServiceResponse())
+
+
+def create_http_app(
+    settings: ExporterSettings,
+    decoder: DecodePool,
+    buffer: WriteBehindBuffer,
+    spool: Spool | None = None,
+    sampler: TailSampler | None = None,
+) -> Litestar:
+    state = {
+        "decoder": decoder,
+        "buffer": buffer,
+        # per signal overrides of the buffer
+        "buffers": {"traces": sampler} if sampler is not None else {},
+        "spool": spool,
+        "max_body_size": settings.http_max_body,
+    }
+    return Litestar(
+        [export_traces, export_logs, export_metrics],
+        state=State(state),
+        request_max_body_size=settings.http_max_body,
+    )
+
+
+def http_server(
+    settings: ExporterSettings,
+    decoder: DecodePool,
+    buffer: WriteBehindBuffer,
+    spool: Spool | None = None,
+    sampler: TailSampler | None = None,
+) -> uvicorn.Server:
+    app = create_http_app(settings, decoder, buffer, spool, sampler)
+    return uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=int(settings.http_port), access_log=False))
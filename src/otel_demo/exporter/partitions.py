@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import re
+from datetime import UTC, date, datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .tables import PARTITION_KEYS
+
+logger = logging.getLogger(__name__)
+
+PARTITION_SUFFIX = re.compile(r"_p(\d{8})$")
+
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> date | None:
+    match = PARTITION_SUFFIX.search(name)
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d").date()
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> list[str]:
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    )
+    return [name for (name,) in result]
+
+
+class PartitionManager:
+    """Keeps daily range partitions of the partitioned tables ahead of time and drops the expired ones.
+
+    Every table also gets a DEFAULT partition, so rows outside the managed days (late or backfilled data, spool
+    replays, clock skew) are never rejected. Expired rows are deleted from it, and rows of a day are moved out of it
+    when that day's partition is created.
+    """
+
+    def __init__(self, engine: AsyncEngine, retention_days: int = 7, premake_days: int = 3, interval: float = 3600):
+        self.engine = engine
+        self.retention_days = retention_days
+        self.premake_days = premake_days
+        self.interval = interval
+
+    async def create_default(self, conn: AsyncConnection, table: str):
+        await conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+    async def create_partition(self, conn: AsyncConnection, table: str, day: date) -> int:
+        """Creates the partition of `day`, returns the number of rows moved into it from the default partition."""
+        key = PARTITION_KEYS[table]
+        in_day = f'"{key}" >= :start AND "{key}" < :end'
+        bounds = {"start": day, "end": day + timedelta(days=1)}
+        # the CREATE fails while the default partition holds rows of the day
+        moved = (await conn.execute(text(f'SELECT count(*) FROM "{table}_default" WHERE {in_day}'), bounds)).scalar()
+        if moved:
+            await conn.execute(text(f'CREATE TEMPORARY TABLE moved_rows (LIKE "{table}") ON COMMIT DROP'))
+            await conn.execute(
+                text(
+                    f'WITH moved AS (DELETE FROM "{table}_default" WHERE {in_day} RETURNING *) '
+                    "INSERT INTO moved_rows SELECT * FROM moved"
+                ),
+                bounds,
+            )
+        await conn.execute(
+            text(
+                f'CREATE TABLE "{partition_name(table, day)}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+        )
+        if moved:
+            await conn.execute(text(f'INSERT INTO "{table}" SELECT * FROM moved_rows'))
+        return moved
+
+    async def create_partitions(self, table: str, today: date):
+        # one transaction per day, so a day that cannot be created doesn't hold back the others
+        async with self.engine.begin() as conn:
+            existing = set(await list_partitions(conn, table))
+        for offset in range(self.premake_days + 1):
+            day = today + timedelta(days=offset)
+            name = partition_name(table, day)
+            if name in existing:
+                continue
+            try:
+                async with self.engine.begin() as conn:
+                    moved = await self.create_partition(conn, table, day)
+                if moved:
+                    logger.info("Moved %d rows from %s_default into %s", moved, table, name)
+            except Exception:
+                logger.exception("Creating partition %s failed", name)
+
+    async def drop_expired(self, conn: AsyncConnection, table: str, today: date) -> list[str]:
+        cutoff = today - timedelta(days=self.retention_days)
+        dropped = []
+        for name in await list_partitions(conn, table):
+            day = partition_day(name)
+            if day is not None and day < cutoff:
+                await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                dropped.append(name)
+        return dropped
+
+    async def expire_default(self, conn: AsyncConnection, table: str, today: date) -> int:
+        cutoff = today - timedelta(days=self.retention_days)
+        result = await conn.execute(
+            text(f'DELETE FROM "{table}_default" WHERE "{PARTITION_KEYS[table]}" < :cutoff'), {"cutoff": cutoff}
+        )
+        return result.rowcount
+
+    async def maintain(self):
+        today = datetime.now(UTC).date()
+        for table in PARTITION_KEYS:
+            # retention in its own transaction, a partition that cannot be created doesn't stop it
+            try:
+                async with self.engine.begin() as conn:
+                    await self.create_default(conn, table)
+                    dropped = await self.drop_expired(conn, table, today)
+                    expired = await self.expire_default(conn, table, today)
+                if dropped:
+                    logger.info("Dropped expired partitions: %s", ", ".join(dropped))
+                if expired:
+                    logger.info("Deleted %d expired rows from %s_default", expired, table)
+            except Exception:
+                logger.exception("Partition retention of %s failed", table)
+            try:
+                await self.create_partitions(table, today)
+            except Exception:
+                logger.exception("Partition maintenance of %s failed", table)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.maintain()
@@ -0,0 +1,72 @@
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+
+
+def frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads of this process from a background thread while running.
+
+    Output is in the folded format (`thread;outer;...;inner count`) read by flamegraph.pl and speedscope.
+    Decode worker processes are not sampled.
+    """
+
+    def __init__(self):
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.interval = 0.005
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval: float = 0.005):
+        if self.running:
+            return
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+        self.interval = interval
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> str:
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        return self.folded()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            current: FrameType | None = frame
+            while current is not None:
+                stack.append(frame_label(current))
+                current = current.f_back
+            stack.append(names.get(ident, str(ident)))
+            with self.lock:
+                self.stacks[";".join(reversed(stack))] += 1
+        with self.lock:
+            self.samples += 1
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def folded(self) -> str:
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
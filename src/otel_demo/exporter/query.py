@@ -0,0 +1,262 @@
+import asyncio
+import json
+import re
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import uvicorn
+from litestar import Litestar, get
+from litestar.datastructures import State
+from litestar.di import Provide
+from litestar.exceptions import NotFoundException, ValidationException
+from litestar.params import Parameter
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, Row, Select, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from .archive import ArchiveReader
+from .settings import get_exporter_settings
+from .tables import schema_metadata
+
+TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+MAX_LIMIT = 500
+
+# with the binary id schema the id columns convert between stored bytes and the hex ids used here
+tables = schema_metadata(binary_ids=get_exporter_settings().binary_ids).tables
+span_t = tables["span"]
+event_t = tables["event"]
+resource_t = tables["resource"]
+
+
+class EventOut(BaseModel):
+    event_no: int
+    time: datetime
+    name: str
+    attributes: dict
+
+
+class SpanOut(BaseModel):
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    start_time: datetime
+    end_time: datetime
+    name: str
+    status: int
+    attributes: dict
+    resource_id: int | None
+    events: list[EventOut] = []
+
+
+class SpanNode(SpanOut):
+    children: list["SpanNode"] = []
+
+
+class TraceOut(BaseModel):
+    trace_id: str
+    spans: list[SpanOut]
+    resources: dict[int, dict]
+
+
+class SpanPage(BaseModel):
+    items: list[SpanOut]
+    next: str | None
+
+
+def span_out(row: Row) -> SpanOut:
+    return SpanOut.model_validate(row._mapping, from_attributes=False)
+
+
+def encode_cursor(span: SpanOut) -> str:
+    return f"{span.start_time.isoformat()}|{span.trace_id}|{span.span_id}"
+
+
+def apply_cursor(stmt: Select, cursor: str | None) -> Select:
+    # keyset pagination on (start_time, trace_id, span_id), newest first
+    if cursor:
+        try:
+            start_time, trace_id, span_id = cursor.split("|")
+            key = (datetime.fromisoformat(start_time), trace_id, span_id)
+            # compared as bytea with the binary id schema, so they have to be hex
+            bytes.fromhex(trace_id + span_id)
+        except ValueError as e:
+            raise ValidationException(f"Invalid cursor: {cursor}") from e
+        stmt = stmt.where(tuple_(span_t.c.start_time, span_t.c.trace_id, span_t.c.span_id) < key)
+    return stmt.order_by(span_t.c.start_time.desc(), span_t.c.trace_id.desc(), span_t.c.span_id.desc())
+
+
+async def fetch_page(conn: AsyncConnection, stmt: Select, cursor: str | None, limit: int) -> SpanPage:
+    stmt = apply_cursor(stmt, cursor).limit(limit + 1)
+    items = [span_out(row) for row in await conn.execute(stmt)]
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return SpanPage(items=items[:limit], next=next_cursor)
+
+
+def span_columns() -> Select:
+    return select(
+        span_t.c.trace_id,
+        span_t.c.span_id,
+        span_t.c.parent_span_id,
+        span_t.c.start_time,
+        span_t.c.end_time,
+        span_t.c.name,
+        span_t.c.status,
+        span_t.c.attributes,
+        span_t.c.resource_id,
+    )
+
+
+def check_trace_id(trace_id: str) -> str:
+    trace_id = trace_id.lower()
+    if not TRACE_ID.match(trace_id):
+        raise ValidationException(f"Invalid trace id: {trace_id}")
+    return trace_id
+
+
+def archived_trace(archive: ArchiveReader, trace_id: str) -> tuple[list[SpanOut], list[dict]]:
+    spans, events = archive.trace(trace_id)
+    # archived attributes are JSON text
+    for row in spans + events:
+        row["attributes"] = json.loads(row["attributes"])
+    events.sort(key=lambda event: (event["span_id"], event["event_no"]))
+    return [SpanOut.model_validate(row) for row in spans], events
+
+
+async def load_trace(conn: AsyncConnection, trace_id: str, archive: ArchiveReader | None = None) -> TraceOut:
+    trace_id = check_trace_id(trace_id)
+    spans = [span_out(row) for row in await conn.execute(span_columns().where(span_t.c.trace_id == trace_id))]
+    if spans:
+        result = await conn.execute(
+            select(event_t.c.span_id, event_t.c.event_no, event_t.c.time, event_t.c.name, event_t.c.attributes)
+            .where(event_t.c.trace_id == trace_id)
+            .order_by(event_t.c.span_id, event_t.c.event_no)
+        )
+        events = [row._mapping for row in result]
+    elif archive is not None:
+        # older than the hot tables keep, scanning the files blocks, so it runs in a thread
+        spans, events = await asyncio.to_thread(archived_trace, archive, trace_id)
+    if not spans:
+        raise NotFoundException(f"Trace {trace_id} not found")
+    by_id = {span.span_id: span for span in spans}
+    for event in events:
+        if (span := by_id.get(event["span_id"])) is not None:
+            span.events.append(EventOut.model_validate(event))
+    resource_ids = {span.resource_id for span in spans if span.resource_id is not None}
+    resources = await conn.execute(
+        select(resource_t.c.resource_id, resource_t.c.attributes).where(resource_t.c.resource_id.in_(resource_ids))
+    )
+    spans.sort(key=lambda span: span.start_time)
+    return TraceOut(trace_id=trace_id, spans=spans, resources={row.resource_id: row.attributes for row in resources})
+
+
+@get("/traces/{trace_id:str}")
+async def get_trace(conn: AsyncConnection, state: State, trace_id: str) -> TraceOut:
+    return await load_trace(conn, trace_id, state.archive)
+
+
+@get("/traces/{trace_id:str}/tree")
+async def get_trace_tree(conn: AsyncConnection, state: State, trace_id: str) -> list[SpanNode]:
+    trace = await load_trace(conn, trace_id, state.archive)
+    nodes = {span.span_id: SpanNode(**span.model_dump()) for span in trace.spans}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node.parent_span_id) if node.parent_span_id else None
+        if parent is None:
+            # spans whose parent lives in another service's trace export show up as roots
+            roots.append(node)
+        else:
+            parent.children.append(node)
+    return roots
+
+
+def attribute_equals(attribute: str, value: str) -> ColumnElement[bool]:
+    # containment is answered by the jsonb_path_ops GIN index, numbers and booleans are matched too
+    condition = span_t.c.attributes.contains({attribute: value})
+    try:
+        typed = json.loads(value)
+    except ValueError:
+        return condition
+    if isinstance(typed, (int, float, bool)):
+        condition = or_(condition, span_t.c.attributes.contains({attribute: typed}))
+    return condition
+
+
+async def service_resource_ids(conn: AsyncConnection, service: str) -> list[int]:
+    result = await conn.execute(
+        select(resource_t.c.resource_id).where(resource_t.c.attributes["service.name"].astext == service)
+    )
+    return list(result.scalars())
+
+
+@get("/spans")
+async def search_spans(
+    conn: AsyncConnection,
+    attribute: str,
+    value: str,
+    service: str | None = None,
+    name: str | None = None,
+    cursor: str | None = None,
+    limit: int = Parameter(default=50, ge=1, le=MAX_LIMIT),
+) -> SpanPage:
+    stmt = span_columns().where(attribute_equals(attribute, value))
+    if name is not None:
+        stmt = stmt.where(span_t.c.name == name)
+    if service is not None:
+        stmt = stmt.where(span_t.c.resource_id.in_(await service_resource_ids(conn, service)))
+    return await fetch_page(conn, stmt, cursor, limit)
+
+
+@get("/services/{service:str}/traces")
+async def latest_traces(
+    conn: AsyncConnection,
+    service: str,
+    cursor: str | None = None,
+    limit: int = Parameter(default=20, ge=1, le=MAX_LIMIT),
+) -> SpanPage:
+    resource_ids = await service_resource_ids(conn, service)
+    if not resource_ids:
+        raise NotFoundException(f"Service {service} not found")
+    stmt = span_columns().where(span_t.c.parent_span_id.is_(None), span_t.c.resource_id.in_(resource_ids))
+    return await fetch_page(conn, stmt, cursor, limit)
+
+
+@get("/services")
+async def list_services(conn: AsyncConnection) -> list[str]:
+    service_name = resource_t.c.attributes["service.name"].astext
+    result = await conn.execute(select(service_name).where(service_name.is_not(None)).distinct().order_by(service_name))
+    return list(result.scalars())
+
+
+async def provide_connection(state: State) -> AsyncGenerator[AsyncConnection, None]:
+    async with state.engine.connect() as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def db_lifespan(app: Litestar):
+    settings = get_exporter_settings()
+    engine = create_async_engine(settings.get_db_url())
+    app.state.engine = engine
+    app.state.archive = ArchiveReader(settings.archive_dir) if settings.archive_dir else None
+    try:
+        yield
+    finally:
+        await engine.dispose()
+
+
+def create_app() -> Litestar:
+    return Litestar(
+        [get_trace, get_trace_tree, search_spans, latest_traces, list_services],
+        dependencies={"conn": Provide(provide_connection)},
+        lifespan=[db_lifespan],
+    )
+
+
+def main():
+    settings = get_exporter_settings()
+    uvicorn.run(create_app(), host="0.0.0.0", port=int(settings.query_port))
+
+
+if __name__ == "__main__":
+    main()
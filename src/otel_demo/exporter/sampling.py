@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass, field
+
+from opentelemetry import metrics
+from opentelemetry.proto.trace.v1.trace_pb2 import Status
+
+from .buffer import BufferFull, WriteBehindBuffer
+from .decode import RowBatch
+
+logger = logging.getLogger(__name__)
+
+SAMPLED_TABLES = ("span", "event")
+TRACE_ID_LIMIT = 1 << 64
+
+meter = metrics.get_meter(__name__)
+sampled_traces = meter.create_counter(
+    "exporter.sampling.traces", unit="{trace}", description="Tail sampling decisions by reason"
+)
+
+
+def ratio_sampled(trace_id: str | bytes, ratio: float) -> bool:
+    # same rule as the SDK's TraceIdRatioBased sampler: the lower 64 bits of the trace id against the ratio
+    if isinstance(trace_id, bytes):
+        return int.from_bytes(trace_id[8:]) < ratio * TRACE_ID_LIMIT
+    return int(trace_id[16:], 16) < ratio * TRACE_ID_LIMIT
+
+
+@dataclass
+class PendingTrace:
+    first_seen: float
+    spans: list[tuple] = field(default_factory=list)
+    events: list[tuple] = field(default_factory=list)
+    error: bool = False
+    max_duration: float = 0.0
+
+    @property
+    def rows(self) -> int:
+        return len(self.spans) + len(self.events)
+
+    def add(self, table: str, row: tuple):
+        if table == "span":
+            self.spans.append(row)
+            self.error = self.error or row[6] == Status.STATUS_CODE_ERROR
+            self.max_duration = max(self.max_duration, (row[4] - row[3]) / 1e9)
+        else:
+            self.events.append(row)
+
+
+class TailSampler:
+    """Holds span and event rows per trace for `decision_wait` seconds, then keeps or drops the whole trace.
+
+    Traces with an error span or a span slower than `latency_threshold` are kept, the rest with probability `ratio`.
+    Once `max_rows` rows are held the oldest traces are decided early. Spans arriving after their trace was decided
+    follow the remembered decision. Other rows (resources, scopes) pass straight through.
+
+    `sample` decides the traces of a batch right away instead, for the spool replayer, whose batches must be written
+    before the spool cursor moves.
+    """
+
+    def __init__(
+        self,
+        buffer: WriteBehindBuffer,
+        decision_wait: float = 10.0,
+        latency_threshold: float = 1.0,
+        ratio: float = 0.1,
+        max_rows: int = 200_000,
+        decisions: int = 100_000,
+    ):
+        self.buffer = buffer
+        self.decision_wait = decision_wait
+        self.latency_threshold = latency_threshold
+        self.ratio = ratio
+        self.max_rows = max_rows
+        self.decisions = decisions
+
+        # trace ids are hex or, with the binary id schema, bytes
+        self.traces: OrderedDict[str | bytes, PendingTrace] = OrderedDict()
+        self.decided: OrderedDict[str | bytes, bool] = OrderedDict()
+        self.held_rows = 0
+        self.ready = RowBatch()
+        self.task: asyncio.Task | None = None
+
+        meter.create_observable_gauge(
+            "exporter.sampling.held", [self.observe_held], unit="{row}", description="Rows waiting for a decision"
+        )
+
+    def observe_held(self, options):
+        yield metrics.Observation(self.held_rows)
+
+    def release(self) -> bool:
+        """Hands kept rows to the write buffer, returns False while it is full."""
+        if not self.ready.row_count():
+            return True
+        try:
+            self.buffer.put(self.ready)
+        except BufferFull:
+            return False
+        self.ready = RowBatch()
+        return True
+
+    def put(self, batch: RowBatch):
+        if not self.release():
+            raise BufferFull("write buffer is full, kept traces are waiting")
+        incoming = sum(batch.count(table) for table in SAMPLED_TABLES)
+        while self.traces and self.held_rows + incoming > self.max_rows:
+            self.decide(*self.traces.popitem(last=False), forced=True)
+
+        now = asyncio.get_running_loop().time()
+        for table, rows in batch.items():
+            if table not in SAMPLED_TABLES:
+                self.ready.setdefault(table, []).extend(rows)
+        for table in SAMPLED_TABLES:
+            for row in batch.get(table, ()):
+                trace_id = row[0]
+                if trace_id in self.decided:
+                    if self.decided[trace_id]:
+                        self.ready.add(table, row)
+                    continue
+                trace = self.traces.get(trace_id)
+                if trace is None:
+                    trace = self.traces[trace_id] = PendingTrace(now)
+                trace.add(table, row)
+                self.held_rows += 1
+        self.release()
+
+    def sample(self, batch: RowBatch) -> RowBatch:
+        """Rows of `batch` to store, every trace is decided on the spans the batch holds."""
+        kept = RowBatch({table: rows for table, rows in batch.items() if table not in SAMPLED_TABLES})
+        traces: dict[str | bytes, PendingTrace] = {}
+        for table in SAMPLED_TABLES:
+            for row in batch.get(table, ()):
+                trace_id = row[0]
+                if trace_id in self.decided:
+                    if self.decided[trace_id]:
+                        kept.add(table, row)
+                    continue
+                trace = traces.get(trace_id)
+                if trace is None:
+                    trace = traces[trace_id] = PendingTrace(0.0)
+                trace.add(table, row)
+        for trace_id, trace in traces.items():
+            if self.keep(trace_id, trace):
+                kept.setdefault("span", []).extend(trace.spans)
+                kept.setdefault("event", []).extend(trace.events)
+        return kept
+
+    def decide(self, trace_id: str | bytes, trace: PendingTrace, forced: bool = False):
+        if self.keep(trace_id, trace, forced):
+            self.ready.setdefault("span", []).extend(trace.spans)
+            self.ready.setdefault("event", []).extend(trace.events)
+        self.held_rows -= trace.rows
+
+    def keep(self, trace_id: str | bytes, trace: PendingTrace, forced: bool = False) -> bool:
+        # remembered, so spans arriving after the decision follow it
+        if trace.error:
+            reason = "error"
+        elif trace.max_duration >= self.latency_threshold:
+            reason = "latency"
+        elif ratio_sampled(trace_id, self.ratio):
+            reason = "ratio"
+        else:
+            reason = "dropped"
+        keep = reason != "dropped"
+        self.decided[trace_id] = keep
+        if len(self.decided) > self.decisions:
+            self.decided.popitem(last=False)
+        sampled_traces.add(1, {"reason": reason, "forced": forced})
+        return keep
+
+    def decide_expired(self):
+        deadline = asyncio.get_running_loop().time() - self.decision_wait
+        while self.traces:
+            trace_id, trace = next(iter(self.traces.items()))
+            if trace.first_seen > deadline:
+                break
+            del self.traces[trace_id]
+            self.decide(trace_id, trace)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(min(self.decision_wait / 4, 1.0))
+            self.decide_expired()
+            self.release()
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.task is not None:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+        while self.traces:
+            self.decide(*self.traces.popitem(last=False))
+        if not self.release():
+            logger.error("Dropping %d sampled rows, the write buffer is full", self.ready.row_count())
@@ -0,0 +1,98 @@
+import os
+from dataclasses import dataclass
+from enum import StrEnum
+
+
+class WriteMode(StrEnum):
+    COPY = "copy"
+    INSERT = "insert"
+
+
+class FsyncPolicy(StrEnum):
+    ALWAYS = "always"
+    INTERVAL = "interval"
+    NEVER = "never"
+
+
+@dataclass
+class ExporterSettings:
+    port: str = "4317"
+    db: str = "postgres:postgres@localhost:5432/postgres"
+    write_mode: WriteMode = WriteMode.COPY
+    buffer_max_rows: int = 200_000
+    flush_rows: int = 10_000
+    flush_interval: float = 1.0
+    flushers: int = 2
+    ignore_conflicts: bool = True
+    dedup_cache: int = 200_000
+    decode_workers: int = 0
+    intern_cache: int = 100_000
+    partitioned: bool = False
+    binary_ids: bool = False
+    archive_dir: str = ""
+    archive_after_days: float = 3
+    archive_chunk_rows: int = 10_000
+    retention_days: int = 7
+    premake_days: int = 3
+    partition_interval: float = 3600
+    query_port: str = "8001"
+    http_port: str = "4318"
+    http_max_body: int = 16 * 1024 * 1024
+    spool_dir: str = ""
+    spool_segment_bytes: int = 64 * 1024 * 1024
+    spool_max_bytes: int = 1024 * 1024 * 1024
+    spool_fsync: FsyncPolicy = FsyncPolicy.INTERVAL
+    spool_fsync_interval: float = 1.0
+    spool_replay_bytes: int = 8 * 1024 * 1024
+    metrics_port: str = "9464"
+    metrics_otlp: bool = False
+    log_level: str = "INFO"
+    tail_sampling: bool = False
+    sampling_decision_wait: float = 10.0
+    sampling_latency_threshold: float = 1.0
+    sampling_ratio: float = 0.1
+    sampling_max_rows: int = 200_000
+
+    def get_db_url(self) -> str:
+        return "postgresql+psycopg://" + self.db
+
+
+def get_exporter_settings() -> ExporterSettings:
+    return ExporterSettings(
+        port=os.getenv("APP_PORT", "4317"),
+        db=os.getenv("APP_DB", "postgres:postgres@localhost:5432/postgres"),
+        write_mode=WriteMode(os.getenv("APP_WRITE_MODE", WriteMode.COPY)),
+        buffer_max_rows=int(os.getenv("APP_BUFFER_MAX_ROWS", "200000")),
+        flush_rows=int(os.getenv("APP_FLUSH_ROWS", "10000")),
+        flush_interval=float(os.getenv("APP_FLUSH_INTERVAL", "1.0")),
+        flushers=int(os.getenv("APP_FLUSHERS", "2")),
+        ignore_conflicts=os.getenv("APP_IGNORE_CONFLICTS", "1") == "1",
+        dedup_cache=int(os.getenv("APP_DEDUP_CACHE", "200000")),
+        decode_workers=int(os.getenv("APP_DECODE_WORKERS", "0")),
+        intern_cache=int(os.getenv("APP_INTERN_CACHE", "100000")),
+        partitioned=os.getenv("APP_PARTITIONED", "0") == "1",
+        binary_ids=os.getenv("APP_BINARY_IDS", "0") == "1",
+        archive_dir=os.getenv("APP_ARCHIVE_DIR", ""),
+        archive_after_days=float(os.getenv("APP_ARCHIVE_AFTER_DAYS", "3")),
+        archive_chunk_rows=int(os.getenv("APP_ARCHIVE_CHUNK_ROWS", "10000")),
+        retention_days=int(os.getenv("APP_RETENTION_DAYS", "7")),
+        premake_days=int(os.getenv("APP_PARTITION_PREMAKE_DAYS", "3")),
+        partition_interval=float(os.getenv("APP_PARTITION_INTERVAL", "3600")),
+        query_port=os.getenv("APP_QUERY_PORT", "8001"),
+        http_port=os.getenv("APP_HTTP_PORT", "4318"),
+        http_max_body=int(os.getenv("APP_HTTP_MAX_BODY", str(16 * 1024 * 1024))),
+        spool_dir=os.getenv("APP_SPOOL_DIR", ""),
+        spool_segment_bytes=int(os.getenv("APP_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+        spool_max_bytes=int(os.getenv("APP_SPOOL_MAX_BYTES", str(1024 * 1024 * 1024))),
+        spool_fsync=FsyncPolicy(os.getenv("APP_SPOOL_FSYNC", FsyncPolicy.INTERVAL)),
+        spool_fsync_interval=float(os.getenv("APP_SPOOL_FSYNC_INTERVAL", "1.0")),
+        spool_replay_bytes=int(os.getenv("APP_SPOOL_REPLAY_BYTES", str(8 * 1024 * 1024))),
+        metrics_port=os.getenv("APP_METRICS_PORT", "9464"),
+        metrics_otlp=os.getenv("APP_METRICS_OTLP", "0") == "1",
+        log_level=os.getenv("APP_LOG_LEVEL", "INFO"),
+        tail_sampling=os.getenv("APP_TAIL_SAMPLING", "0") == "1",
+        sampling_decision_wait=float(os.getenv("APP_SAMPLING_DECISION_WAIT", "10.0")),
+        sampling_latency_threshold=float(os.getenv("APP_SAMPLING_LATENCY_THRESHOLD", "1.0")),
+        sampling_ratio=float(os.getenv("APP_SAMPLING_RATIO", "0.1")),
+        sampling_max_rows=int(os.getenv("APP_SAMPLING_MAX_ROWS", "200000")),
+    )
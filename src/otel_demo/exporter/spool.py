@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from contextlib import suppress
+from dataclasses import dataclass
+from pathlib import Path
+
+from google.protobuf.json_format import ParseError
+from google.protobuf.message import DecodeError
+from opentelemetry import metrics
+
+from .decode import RowBatch
+from .decode_pool import DecodePool
+from .dedup import DedupFilter
+from .ingest import BulkWriter
+from .intern import InternCache
+from .sampling import TailSampler
+from .settings import FsyncPolicy
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("traces", "logs", "metrics")
+FLAG_JSON = 1
+# payload length, crc32 of the payload, kind, flags, accept time in ns
+HEADER = struct.Struct("<IIBBq")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+class SpoolFull(Exception):
+    pass
+
+
+@dataclass
+class Record:
+    kind: str
+    data: bytes
+    as_json: bool
+    time_ns: int
+
+
+@dataclass(frozen=True, order=True)
+class Position:
+    segment: int
+    offset: int
+
+
+def segment_path(path: Path, segment: int) -> Path:
+    return path / f"{segment:020d}{SEGMENT_SUFFIX}"
+
+
+def encode_record(kind: str, data: bytes, as_json: bool, time_ns: int) -> bytes:
+    flags = FLAG_JSON if as_json else 0
+    return HEADER.pack(len(data), zlib.crc32(data), KINDS.index(kind), flags, time_ns) + data
+
+
+def read_records(file, limit: int | None, max_bytes: int) -> tuple[list[Record], int]:
+    """Reads whole records from the current file position, returns them with the number of bytes consumed.
+
+    Stops at `limit` (the end of the written part of an active segment), after `max_bytes` or at a torn record.
+    """
+    records: list[Record] = []
+    consumed = 0
+    while consumed < max_bytes and (limit is None or file.tell() < limit):
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            break
+        length, crc, kind, flags, time_ns = HEADER.unpack(header)
+        data = file.read(length)
+        if len(data) < length or zlib.crc32(data) != crc or kind >= len(KINDS):
+            break
+        records.append(Record(KINDS[kind], data, bool(flags & FLAG_JSON), time_ns))
+        consumed += HEADER.size + length
+    return records, consumed
+
+
+class Spool:
+    """Append-only log of accepted OTLP requests, split into numbered segment files.
+
+    Appends are acknowledged once written (and fsynced under `FsyncPolicy.ALWAYS`). The read position of the
+    replayer is persisted in the cursor file, segments before it are deleted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: FsyncPolicy = FsyncPolicy.INTERVAL,
+        fsync_interval: float = 1.0,
+    ):
+        self.path = Path(path)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self.segments: dict[int, int] = {}
+        self.cursor = Position(0, 0)
+        self.read_position = self.cursor
+        self.active = 0
+        self.fd: int | None = None
+        self.appended_bytes = 0
+        self.synced_bytes = 0
+        self.lock = asyncio.Lock()
+        self.sync_lock = asyncio.Lock()
+        self.appended = asyncio.Event()
+        self.syncer: asyncio.Task | None = None
+
+    @property
+    def size(self) -> int:
+        return sum(self.segments.values())
+
+    @property
+    def depth(self) -> int:
+        """Bytes accepted but not yet committed to the database."""
+        return sum(size for segment, size in self.segments.items() if segment >= self.cursor.segment) - (
+            self.cursor.offset if self.cursor.segment in self.segments else 0
+        )
+
+    def load_cursor(self) -> Position:
+        try:
+            segment, offset = (self.path / CURSOR_FILE).read_text().split()
+        except FileNotFoundError:
+            return Position(min(self.segments, default=0), 0)
+        return Position(int(segment), int(offset))
+
+    def save_cursor(self, position: Position):
+        tmp = self.path / f"{CURSOR_FILE}.tmp"
+        with open(tmp, "w") as file:
+            file.write(f"{position.segment} {position.offset}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, self.path / CURSOR_FILE)
+
+    def recover(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        for file in self.path.glob(f"*{SEGMENT_SUFFIX}"):
+            self.segments[int(file.stem)] = file.stat().st_size
+        self.cursor = self.load_cursor()
+        if self.segments:
+            # only the segment written last can end with a torn record
+            last = max(self.segments)
+            start = self.cursor.offset if self.cursor.segment == last else 0
+            with open(segment_path(self.path, last), "rb+") as file:
+                file.seek(start)
+                _, consumed = read_records(file, None, self.segments[last])
+                if start + consumed < self.segments[last]:
+                    logger.warning("Truncating torn spool segment %d at %d", last, start + consumed)
+                    file.truncate(start + consumed)
+                    self.segments[last] = start + consumed
+        for segment in [segment for segment in self.segments if segment < self.cursor.segment]:
+            self.remove_segment(segment)
+        self.read_position = self.cursor
+        # appends always go to a fresh segment, recovered ones are only read
+        self.open_segment(max(self.segments, default=self.cursor.segment - 1) + 1)
+
+    def open_segment(self, segment: int):
+        self.active = segment
+        self.fd = os.open(segment_path(self.path, segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.segments[segment] = 0
+
+    def remove_segment(self, segment: int):
+        segment_path(self.path, segment).unlink(missing_ok=True)
+        self.segments.pop(segment, None)
+
+    async def roll(self):
+        async with self.sync_lock:
+            if self.fsync != FsyncPolicy.NEVER:
+                await asyncio.to_thread(os.fsync, self.fd)
+                self.synced_bytes = self.appended_bytes
+            os.close(self.fd)
+            self.open_segment(self.active + 1)
+
+    async def append(self, kind: str, data: bytes, as_json: bool = False):
+        record = encode_record(kind, data, as_json, time.time_ns())
+        async with self.lock:
+            if self.size + len(record) > self.max_bytes:
+                raise SpoolFull(f"spool is full ({self.size}/{self.max_bytes} bytes)")
+            if self.segments[self.active] and self.segments[self.active] + len(record) > self.segment_bytes:
+                await self.roll()
+            # a single unbuffered write, so the replayer never sees half a record from a live segment
+            os.write(self.fd, record)
+            self.segments[self.active] += len(record)
+            self.appended_bytes += len(record)
+        self.appended.set()
+        if self.fsync == FsyncPolicy.ALWAYS:
+            await self.sync()
+
+    async def sync(self):
+        # group commit: appends waiting on the lock are covered by the fsync that just finished
+        target = self.appended_bytes
+        async with self.sync_lock:
+            if self.synced_bytes >= target:
+                return
+            position = self.appended_bytes
+            await asyncio.to_thread(os.fsync, self.fd)
+            self.synced_bytes = position
+
+    async def run_syncer(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            await self.sync()
+
+    def read_segment(self, position: Position, limit: int | None, max_bytes: int) -> tuple[list[Record], int]:
+        with open(segment_path(self.path, position.segment), "rb") as file:
+            file.seek(position.offset)
+            return read_records(file, limit, max_bytes)
+
+    async def read(self, max_bytes: int) -> tuple[list[Record], Position]:
+        """Returns records after the last read position and the position following them."""
+        position = self.read_position
+        while True:
+            if position.segment not in self.segments:
+                if position.segment >= self.active:
+                    return [], position
+                position = Position(position.segment + 1, 0)
+                continue
+            limit = self.segments[position.segment] if position.segment == self.active else None
+            records, consumed = await asyncio.to_thread(self.read_segment, position, limit, max_bytes)
+            if records:
+                self.read_position = Position(position.segment, position.offset + consumed)
+                return records, self.read_position
+            if position.segment >= self.active:
+                return [], position
+            position = Position(position.segment + 1, 0)
+
+    def rewind(self):
+        """Reads start again at the cursor, after a batch that was read could not be written."""
+        self.read_position = self.cursor
+
+    async def commit(self, position: Position):
+        await asyncio.to_thread(self.save_cursor, position)
+        self.cursor = position
+        for segment in [segment for segment in self.segments if segment < position.segment]:
+            self.remove_segment(segment)
+
+    async def __aenter__(self):
+        await asyncio.to_thread(self.recover)
+        if self.fsync == FsyncPolicy.INTERVAL:
+            self.syncer = asyncio.create_task(self.run_syncer())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.syncer is not None:
+            self.syncer.cancel()
+            # an fsync in progress holds the fd
+            with suppress(asyncio.CancelledError):
+                await self.syncer
+        if self.fd is not None:
+            if self.fsync != FsyncPolicy.NEVER:
+                await asyncio.to_thread(os.fsync, self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+
+class SpoolReplayer:
+    """Drains the spool into the database in large batches, retrying until the database accepts them.
+
+    The cursor only moves once a batch is committed, so a crash replays at most one batch. Replayed duplicates are
+    dropped by the dedup filter or `ON CONFLICT DO NOTHING`. With a `sampler`, the traces of each batch are sampled
+    before it is written.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        decoder: DecodePool,
+        writer: BulkWriter,
+        batch_bytes: int = 8 * 1024 * 1024,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 30.0,
+        dedup: DedupFilter | None = None,
+        interned: InternCache | None = None,
+        sampler: TailSampler | None = None,
+    ):
+        self.spool = spool
+        self.decoder = decoder
+        self.writer = writer
+        self.batch_bytes = batch_bytes
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.dedup = dedup
+        self.interned = interned
+        self.sampler = sampler
+        self.oldest_pending_ns: int | None = None
+
+        meter = metrics.get_meter(__name__)
+        meter.create_observable_gauge(
+            "exporter.spool.depth", [self.observe_depth], unit="By", description="Spooled bytes not yet replayed"
+        )
+        meter.create_observable_gauge(
+            "exporter.spool.lag", [self.observe_lag], unit="s", description="Age of the oldest record not replayed"
+        )
+
+    def observe_depth(self, options):
+        yield metrics.Observation(self.spool.depth)
+
+    def observe_lag(self, options):
+        yield metrics.Observation(self.lag)
+
+    @property
+    def lag(self) -> float:
+        if self.oldest_pending_ns is None:
+            return 0.0
+        return max(time.time_ns() - self.oldest_pending_ns, 0) / 1e9
+
+    async def decode(self, records: list[Record]) -> RowBatch:
+        batch = RowBatch()
+        results = await asyncio.gather(
+            *(getattr(self.decoder, record.kind)(record.data, record.as_json) for record in records),
+            return_exceptions=True,
+        )
+        for record, result in zip(records, results):
+            if isinstance(result, (DecodeError, ParseError, ValueError)):
+                logger.error("Skipping malformed spooled %s request: %s", record.kind, result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                batch.merge(result)
+        return batch
+
+    async def write(self, batch: RowBatch):
+        keys, interned_keys = [], []
+        if self.dedup is not None:
+            batch, keys = self.dedup.filter(batch)
+        if self.interned is not None:
+            batch, interned_keys = self.interned.filter(batch)
+        delay = self.retry_delay
+        while batch.row_count():
+            try:
+                await self.writer.write(batch)
+                break
+            except Exception:
+                logger.exception("Replay of %d rows failed, retrying in %.0fs", batch.row_count(), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+        if self.dedup is not None:
+            self.dedup.remember(keys)
+        if self.interned is not None:
+            self.interned.remember(interned_keys)
+
+    async def replay_once(self) -> bool:
+        records, position = await self.spool.read(self.batch_bytes)
+        if not records:
+            self.oldest_pending_ns = None
+            return False
+        self.oldest_pending_ns = records[0].time_ns
+        batch = await self.decode(records)
+        if self.sampler is not None:
+            batch = self.sampler.sample(batch)
+        await self.write(batch)
+        await self.spool.commit(position)
+        logger.debug("Replayed %d requests, %d rows", len(records), batch.row_count())
+        return True
+
+    async def run(self):
+        delay = self.retry_delay
+        while True:
+            self.spool.appended.clear()
+            try:
+                replayed = await self.replay_once()
+            except Exception:
+                # e.g. a broken decode pool, the replay must not stop while requests keep being spooled
+                logger.exception("Spool replay failed, retrying in %.0fs", delay)
+                self.spool.rewind()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            delay = self.retry_delay
+            if not replayed:
+                await self.spool.appended.wait()
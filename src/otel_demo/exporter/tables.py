@@ -1,18 +1,29 @@
+from functools import cache
 from typing import List, Optional
 from uuid import UUID
 
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
     DateTime,
+    Double,
     ForeignKeyConstraint,
+    Index,
     Integer,
+    LargeBinary,
+    MetaData,
     PrimaryKeyConstraint,
     String,
+    Table,
     Text,
+    TypeDecorator,
+    text,
 )
 from sqlalchemy import (
     Uuid as sa_Uuid,
 )
-from sqlalchemy.dialects.postgresql import JSONB, TIMESTAMP
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TIMESTAMP
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -20,6 +31,24 @@ class Base(DeclarativeBase):
     pass
 
 
+class Resource(Base):
+    __tablename__ = "resource"
+
+    resource_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    attributes: Mapped[dict] = mapped_column(JSONB)
+
+    __table_args__ = (Index("ix_resource_service_name", text("(attributes ->> 'service.name')")),)
+
+
+class Scope(Base):
+    __tablename__ = "scope"
+
+    scope_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    name: Mapped[str] = mapped_column(String)
+    version: Mapped[str] = mapped_column(String)
+    attributes: Mapped[dict] = mapped_column(JSONB)
+
+
 class Span(Base):
     __tablename__ = "span"
 
@@ -32,6 +61,8 @@ class Span(Base):
     status: Mapped[int] = mapped_column(Integer)
     attributes: Mapped[dict] = mapped_column(JSONB)
     state: Mapped[str] = mapped_column(Text)
+    resource_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+    scope_id: Mapped[Optional[int]] = mapped_column(BigInteger)
     events: Mapped[List["Event"]] = relationship("Event")
 
     __table_args__ = (PrimaryKeyConstraint(trace_id, span_id),)
@@ -69,5 +100,149 @@ class Log(Base):
     time: Mapped[DateTime] = mapped_column(TIMESTAMP(timezone=False, precision=9))
     attributes: Mapped[dict] = mapped_column(JSONB)
     body: Mapped[Optional[str]] = mapped_column(Text)
+    resource_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+    scope_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+
+    __table_args__ = (PrimaryKeyConstraint(trace_id, span_id, time, log_id),)
+
+
+class MetricSeries(Base):
+    __tablename__ = "metric_series"
+
+    series_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    name: Mapped[str] = mapped_column(String)
+    kind: Mapped[str] = mapped_column(String(16))
+    unit: Mapped[str] = mapped_column(String)
+    temporality: Mapped[int] = mapped_column(Integer)
+    monotonic: Mapped[bool] = mapped_column(Boolean)
+    resource_id: Mapped[int] = mapped_column(BigInteger)
+    scope_id: Mapped[int] = mapped_column(BigInteger)
+    attributes: Mapped[dict] = mapped_column(JSONB)
+
+
+class MetricPoint(Base):
+    __tablename__ = "metric_point"
+
+    series_id: Mapped[int] = mapped_column(BigInteger)
+    time: Mapped[DateTime] = mapped_column(TIMESTAMP(timezone=False, precision=9))
+    value: Mapped[float] = mapped_column(Double)
 
-    __mapper_args__ = {"primary_key": [trace_id, span_id, time]}
+    __table_args__ = (PrimaryKeyConstraint(series_id, time),)
+
+
+class MetricHistogram(Base):
+    __tablename__ = "metric_histogram"
+
+    series_id: Mapped[int] = mapped_column(BigInteger)
+    time: Mapped[DateTime] = mapped_column(TIMESTAMP(timezone=False, precision=9))
+    count: Mapped[int] = mapped_column(BigInteger)
+    sum: Mapped[Optional[float]] = mapped_column(Double)
+    bounds: Mapped[List[float]] = mapped_column(ARRAY(Double))
+    counts: Mapped[List[int]] = mapped_column(ARRAY(BigInteger))
+
+    __table_args__ = (PrimaryKeyConstraint(series_id, time),)
+
+
+def span_indexes(table: Table) -> list[Index]:
+    return [
+        Index("ix_span_start_time", table.c.start_time, postgresql_using="brin"),
+        Index(
+            "ix_span_attributes",
+            table.c.attributes,
+            postgresql_using="gin",
+            postgresql_ops={"attributes": "jsonb_path_ops"},
+        ),
+        Index("ix_span_name_start_time", table.c.name, table.c.start_time),
+        # latest traces of a service: root spans by resource, newest first
+        Index(
+            "ix_span_root_resource_start_time",
+            table.c.resource_id,
+            table.c.start_time,
+            postgresql_where=table.c.parent_span_id.is_(None),
+        ),
+    ]
+
+
+def event_indexes(table: Table) -> list[Index]:
+    return [Index("ix_event_time", table.c.time, postgresql_using="brin")]
+
+
+def log_indexes(table: Table) -> list[Index]:
+    return [
+        Index("ix_log_time", table.c.time, postgresql_using="brin"),
+        Index(
+            "ix_log_attributes",
+            table.c.attributes,
+            postgresql_using="gin",
+            postgresql_ops={"attributes": "jsonb_path_ops"},
+        ),
+    ]
+
+
+# defined per table object, so the partitioned variants get the same indexes
+INDEXES = {"span": span_indexes, "event": event_indexes, "log": log_indexes}
+
+for _name, _indexes in INDEXES.items():
+    _indexes(Base.metadata.tables[_name])
+
+
+# partitioned schema mode: table -> range partition key
+PARTITION_KEYS = {"span": "start_time", "event": "time", "log": "time"}
+
+
+def partitioned_table(table: Table, metadata: MetaData, key: str) -> Table:
+    # the primary key of a partitioned table must contain the partition key, so the event -> span
+    # foreign key cannot be kept either
+    primary_key = [column.name for column in table.primary_key.columns]
+    if key not in primary_key:
+        primary_key.append(key)
+    partitioned = Table(
+        table.name,
+        metadata,
+        *(Column(column.name, column.type, nullable=column.nullable) for column in table.columns),
+        PrimaryKeyConstraint(*primary_key),
+        postgresql_partition_by=f"RANGE ({key})",
+    )
+    if table.name in INDEXES:
+        INDEXES[table.name](partitioned)
+    return partitioned
+
+
+# binary id schema mode: trace and span ids as bytea instead of hex text, half the size in every key and index
+ID_COLUMNS = frozenset(("trace_id", "span_id", "parent_span_id"))
+
+
+class BinaryId(TypeDecorator):
+    """bytea id that reads back as hex, so queries keep working with hex ids. Binds raw bytes or hex."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            return bytes.fromhex(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return value.hex()
+
+
+@cache
+def schema_metadata(partitioned: bool = False, binary_ids: bool = False) -> MetaData:
+    if not partitioned and not binary_ids:
+        return Base.metadata
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        key = PARTITION_KEYS.get(table.name) if partitioned else None
+        if key is None:
+            table.to_metadata(metadata)
+        else:
+            partitioned_table(table, metadata, key)
+    if binary_ids:
+        for table in metadata.sorted_tables:
+            for column in table.columns:
+                if column.name in ID_COLUMNS:
+                    column.type = BinaryId()
+    return metadata
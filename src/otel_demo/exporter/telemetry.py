@@ -0,0 +1,133 @@
+import os
+import re
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import (
+    Gauge,
+    Histogram,
+    InMemoryMetricReader,
+    MetricReader,
+    MetricsData,
+    PeriodicExportingMetricReader,
+    Sum,
+)
+from opentelemetry.sdk.resources import Resource
+
+from otel_demo.utils.base import create_metric_exporter, get_otel_settings
+
+from .settings import ExporterSettings
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1_000, 5_000, 10_000, 50_000, 100_000)
+
+meter = metrics.get_meter("otel_demo.exporter")
+requests = meter.create_counter(
+    "exporter.requests", unit="{request}", description="Export requests by signal, transport and outcome"
+)
+received_bytes = meter.create_counter("exporter.received", unit="By", description="Export request bytes received")
+decode_duration = meter.create_histogram(
+    "exporter.decode.duration",
+    unit="s",
+    description="Time to decode one export request into rows",
+    explicit_bucket_boundaries_advisory=DURATION_BUCKETS,
+)
+request_rows = meter.create_histogram(
+    "exporter.request.rows",
+    unit="{row}",
+    description="Rows decoded from one export request",
+    explicit_bucket_boundaries_advisory=ROW_BUCKETS,
+)
+transaction_duration = meter.create_histogram(
+    "exporter.db.transaction.duration",
+    unit="s",
+    description="Duration of one bulk write transaction",
+    explicit_bucket_boundaries_advisory=DURATION_BUCKETS,
+)
+written_rows = meter.create_counter(
+    "exporter.db.rows", unit="{row}", description="Rows written by table, including rows skipped as conflicts"
+)
+dropped_rows = meter.create_counter("exporter.buffer.dropped", unit="{row}", description="Rows dropped after retries")
+
+
+def record_request(signal: str, transport: str, size: int, outcome: str):
+    requests.add(1, {"signal": signal, "transport": transport, "outcome": outcome})
+    received_bytes.add(size, {"signal": signal, "transport": transport})
+
+
+@contextmanager
+def timed(histogram: metrics.Histogram, attributes: dict[str, str]) -> Iterator[dict[str, str]]:
+    """Records the duration of the block, attributes added to the yielded dict inside the block are recorded too."""
+    attributes = dict(attributes)
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        histogram.record(time.perf_counter() - start, attributes)
+
+
+def otlp_reader() -> MetricReader:
+    otel_settings = get_otel_settings()
+    exporter = create_metric_exporter(otel_settings)
+    return PeriodicExportingMetricReader(exporter, export_interval_millis=otel_settings.metric_export_interval_millis)
+
+
+def setup_telemetry(settings: ExporterSettings) -> tuple[MeterProvider, InMemoryMetricReader | None]:
+    """Installs the global meter provider, with a pull reader backing /metrics and optionally OTLP export."""
+    readers: list[MetricReader] = []
+    scrape_reader = None
+    if settings.metrics_port:
+        scrape_reader = InMemoryMetricReader()
+        readers.append(scrape_reader)
+    if settings.metrics_otlp:
+        readers.append(otlp_reader())
+    resource = Resource(
+        attributes={
+            "service.name": os.getenv("OTEL_SERVICE_NAME", "otel-demo-exporter"),
+            "service.namespace": os.getenv("OTEL_SERVICE_NAMESPACE", "default"),
+        }
+    )
+    provider = MeterProvider(metric_readers=readers, resource=resource)
+    metrics.set_meter_provider(provider)
+    return provider, scrape_reader
+
+
+def prometheus_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def prometheus_labels(attributes, **extra) -> str:
+    labels = {**{prometheus_name(key): value for key, value in (attributes or {}).items()}, **extra}
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def render_prometheus(data: MetricsData | None) -> str:
+    """Renders cumulative metrics in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for resource_metrics in data.resource_metrics if data is not None else ():
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                name = prometheus_name(metric.name)
+                points = metric.data.data_points
+                if isinstance(metric.data, Sum) and metric.data.is_monotonic:
+                    lines += [f"# HELP {name}_total {metric.description}", f"# TYPE {name}_total counter"]
+                    lines += [f"{name}_total{prometheus_labels(point.attributes)} {point.value}" for point in points]
+                elif isinstance(metric.data, (Sum, Gauge)):
+                    lines += [f"# HELP {name} {metric.description}", f"# TYPE {name} gauge"]
+                    lines += [f"{name}{prometheus_labels(point.attributes)} {point.value}" for point in points]
+                elif isinstance(metric.data, Histogram):
+                    lines += [f"# HELP {name} {metric.description}", f"# TYPE {name} histogram"]
+                    for point in points:
+                        cumulative = 0
+                        for bound, count in zip((*point.explicit_bounds, "+Inf"), point.bucket_counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{prometheus_labels(point.attributes, le=bound)} {cumulative}")
+                        lines.append(f"{name}_sum{prometheus_labels(point.attributes)} {point.sum}")
+                        lines.append(f"{name}_count{prometheus_labels(point.attributes)} {point.count}")
+    return "\n".join(lines) + "\n"
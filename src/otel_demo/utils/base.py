@@ -1,22 +1,38 @@
+import atexit
 import os
+import random
+import threading
+import time
 from dataclasses import dataclass
-from logging import INFO, Formatter, Logger, getLogger
-from typing import Mapping
+from logging import INFO, WARNING, Filter, Formatter, Logger, LogRecord, getLogger
+from typing import Mapping, Sequence
 from urllib.parse import urljoin
 
+import grpc
 from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter as GRPCLogExporter
 from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter as GRPCMetricExporter
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter as GRPCSpanExporter
+from opentelemetry.exporter.otlp.proto.http import Compression as HTTPCompression
 from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter as HTTPLogExporter
 from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter as HTTPMetricExporter
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter as HTTPSpanExporter
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
 from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
 from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult, PeriodicExportingMetricReader
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import Link, SpanKind, get_current_span
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
 
 
 @dataclass
@@ -26,6 +42,27 @@ class OtelSettings:
     svc_name: str | None = None
     svc_ns: str | None = None
     extra_attrs: Mapping[str, int | str] | None = None
+    # span batch processor
+    max_queue_size: int = 2048
+    max_export_batch_size: int = 512
+    schedule_delay_millis: float = 5000
+    export_timeout_millis: float = 30000
+    # log record batch processor
+    log_max_queue_size: int = 2048
+    log_max_export_batch_size: int = 512
+    log_schedule_delay_millis: float = 5000
+    log_export_timeout_millis: float = 30000
+    # OTLP exporters
+    timeout: float = 10.0
+    gzip: bool = False
+    metric_export_interval_millis: float = 60000
+    # sampling, the defaults keep everything
+    trace_ratio: float = 1.0
+    # new traces per second, 0 is unlimited
+    trace_rate_limit: float = 0
+    # span name -> ratio, applied to every span with that name, also below a sampled parent
+    trace_rules: Mapping[str, float] | None = None
+    log_ratio: float = 1.0
 
     def get_endpoint(self) -> str:
         if self.endpoint is None:
@@ -36,65 +73,323 @@ class OtelSettings:
         else:
             return self.endpoint
 
+    def pipeline_key(self) -> tuple:
+        return (
+            self.get_endpoint(),
+            self.use_grpc,
+            self.max_queue_size,
+            self.max_export_batch_size,
+            self.schedule_delay_millis,
+            self.export_timeout_millis,
+            self.log_max_queue_size,
+            self.log_max_export_batch_size,
+            self.log_schedule_delay_millis,
+            self.log_export_timeout_millis,
+            self.timeout,
+            self.gzip,
+        )
+
+    def sampling_key(self) -> tuple:
+        return self.trace_ratio, self.trace_rate_limit, tuple(sorted((self.trace_rules or {}).items())), self.log_ratio
+
+
+def parse_sample_rules(value: str) -> dict[str, float]:
+    """`process=0.1,send=0` -> {"process": 0.1, "send": 0.0}"""
+    rules = {}
+    for rule in value.split(","):
+        if rule.strip():
+            name, ratio = rule.rsplit("=", 1)
+            rules[name.strip()] = float(ratio)
+    return rules
+
 
 def get_otel_settings(extra_attrs: Mapping[str, int | str] | None = None) -> OtelSettings:
+    max_queue_size = os.getenv("OTEL_BSP_MAX_QUEUE_SIZE", "2048")
+    max_export_batch_size = os.getenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "512")
+    schedule_delay_millis = os.getenv("OTEL_BSP_SCHEDULE_DELAY", "5000")
+    export_timeout_millis = os.getenv("OTEL_BSP_EXPORT_TIMEOUT", "30000")
     return OtelSettings(
         endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"),
         use_grpc=os.getenv("OTEL_EXPORTER_OTLP_USE_GRPC", "1") == "1",
         svc_name=os.getenv("OTEL_SERVICE_NAME"),
         svc_ns=os.getenv("OTEL_SERVICE_NAMESPACE"),
         extra_attrs=extra_attrs,
+        max_queue_size=int(max_queue_size),
+        max_export_batch_size=int(max_export_batch_size),
+        schedule_delay_millis=float(schedule_delay_millis),
+        export_timeout_millis=float(export_timeout_millis),
+        # the log processor's own variables, falling back to the span processor's
+        log_max_queue_size=int(os.getenv("OTEL_BLRP_MAX_QUEUE_SIZE", max_queue_size)),
+        log_max_export_batch_size=int(os.getenv("OTEL_BLRP_MAX_EXPORT_BATCH_SIZE", max_export_batch_size)),
+        log_schedule_delay_millis=float(os.getenv("OTEL_BLRP_SCHEDULE_DELAY", schedule_delay_millis)),
+        log_export_timeout_millis=float(os.getenv("OTEL_BLRP_EXPORT_TIMEOUT", export_timeout_millis)),
+        timeout=float(os.getenv("OTEL_EXPORTER_OTLP_TIMEOUT", "10")),
+        gzip=os.getenv("OTEL_EXPORTER_OTLP_COMPRESSION", "none") == "gzip",
+        metric_export_interval_millis=float(os.getenv("OTEL_METRIC_EXPORT_INTERVAL", "60000")),
+        trace_ratio=float(os.getenv("OTEL_TRACES_SAMPLE_RATIO", "1")),
+        trace_rate_limit=float(os.getenv("OTEL_TRACES_RATE_LIMIT", "0")),
+        trace_rules=parse_sample_rules(os.getenv("OTEL_TRACES_SAMPLE_RULES", "")),
+        log_ratio=float(os.getenv("OTEL_LOGS_SAMPLE_RATIO", "1")),
     )
 
 
-def prepare_utils(settings: OtelSettings) -> tuple[MeterProvider, TracerProvider, Logger]:
-    svc_name = settings.svc_name or "rg-unnamed"
-    svc_ns = settings.svc_ns or "default"
-    extra_attrs = settings.extra_attrs or {}
-
-    resource = Resource(
-        attributes={
-            "service.name": svc_name,
-            "service.namespace": svc_ns,
-            **extra_attrs,
-        }
-    )
+class RateLimitingSampler(Sampler):
+    """Samples what `delegate` samples, up to `per_second` spans per second (token bucket, bursts up to one second).
 
-    endpoint = settings.get_endpoint()
+    The bucket holds at least one token, so rates below 1/s still sample a span every `1 / per_second` seconds.
+    """
 
-    if settings.use_grpc:
-        trace_endpoint = endpoint
-        otlp_span_exporter = GRPCSpanExporter(endpoint=trace_endpoint, insecure=True)
-    else:
-        trace_endpoint = urljoin(endpoint, "/v1/traces")
-        otlp_span_exporter = HTTPSpanExporter(endpoint=trace_endpoint)
-    span_processor = BatchSpanProcessor(otlp_span_exporter)
-    tracer_prov = TracerProvider(resource=resource)
-    tracer_prov.add_span_processor(span_processor)
+    def __init__(self, per_second: float, delegate: Sampler):
+        self.per_second = per_second
+        self.delegate = delegate
+        self.capacity = max(1.0, per_second)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
-    if settings.use_grpc:
-        metric_endpoint = endpoint  # urljoin(endpoint, "/opentelemetry.proto.collector.trace.v1.MetricService/Export")
-        otlp_metric_exporter = GRPCMetricExporter(endpoint=metric_endpoint, insecure=True)
-    else:
-        metric_endpoint = endpoint  # urljoin(endpoint, "/v1/metrics")
-        otlp_metric_exporter = HTTPMetricExporter(endpoint=metric_endpoint)
-    metric_reader = PeriodicExportingMetricReader(otlp_metric_exporter, export_interval_millis=60000)
-    meter_prov = MeterProvider(metric_readers=[metric_reader], resource=resource)
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def should_sample(
+        self,
+        parent_context,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: TraceState | None = None,
+    ) -> SamplingResult:
+        result = self.delegate.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        if result.decision.is_sampled() and not self.take():
+            return SamplingResult(Decision.DROP, None, result.trace_state)
+        return result
+
+    def get_description(self) -> str:
+        return f"RateLimiting{{{self.per_second:g}/s,{self.delegate.get_description()}}}"
+
+
+class SpanNameSampler(Sampler):
+    """Drops spans by name before `delegate` decides.
+
+    The ratio is applied to the trace id, so spans with the same name are kept or dropped together within one trace and
+    across services. A dropped span's children are dropped with it.
+    """
 
+    def __init__(self, rules: Mapping[str, float], delegate: Sampler):
+        self.rules = {name: TraceIdRatioBased(ratio) for name, ratio in rules.items()}
+        self.delegate = delegate
+
+    def should_sample(
+        self,
+        parent_context,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: TraceState | None = None,
+    ) -> SamplingResult:
+        rule = self.rules.get(name)
+        if rule is not None:
+            result = rule.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+            if not result.decision.is_sampled():
+                return result
+        return self.delegate.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+
+    def get_description(self) -> str:
+        rules = ",".join(f"{name}={rule.rate:g}" for name, rule in self.rules.items())
+        return f"SpanName{{{rules},{self.delegate.get_description()}}}"
+
+
+def create_sampler(settings: OtelSettings) -> Sampler | None:
+    """None without sampling settings, the provider then falls back to `OTEL_TRACES_SAMPLER`."""
+    if settings.trace_ratio >= 1 and not settings.trace_rate_limit and not settings.trace_rules:
+        return None
+    # new traces are sampled by ratio and rate, spans with a parent follow the parent's decision
+    root: Sampler = TraceIdRatioBased(settings.trace_ratio)
+    if settings.trace_rate_limit:
+        root = RateLimitingSampler(settings.trace_rate_limit, root)
+    sampler: Sampler = ParentBased(root)
+    if settings.trace_rules:
+        sampler = SpanNameSampler(settings.trace_rules, sampler)
+    return sampler
+
+
+class LogSampler(Filter):
+    """Keeps WARNING and above and `ratio` of other records.
+
+    Records logged inside a span are sampled by trace id like `TraceIdRatioBased`, so a trace keeps all or none of its
+    records, and with equal ratios exactly the sampled traces keep them.
+    """
+
+    def __init__(self, ratio: float):
+        super().__init__()
+        self.ratio = ratio
+        self.bound = TraceIdRatioBased.get_bound_for_rate(ratio)
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno >= WARNING:
+            return True
+        span_context = get_current_span().get_span_context()
+        if span_context.is_valid:
+            return span_context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self.bound
+        return random.random() < self.ratio
+
+
+def create_metric_exporter(settings: OtelSettings) -> MetricExporter:
+    endpoint = settings.get_endpoint()
     if settings.use_grpc:
-        log_endpoint = endpoint  # urljoin(endpoint, "/opentelemetry.proto.collector.log.v1.LogService/Export")
-        otlp_log_exporter = GRPCLogExporter(endpoint=log_endpoint, insecure=True)
-    else:
-        log_endpoint = urljoin(endpoint, "/v1/logs")
-        otlp_log_exporter = HTTPLogExporter(endpoint=log_endpoint)
-    log_processor = BatchLogRecordProcessor(otlp_log_exporter)
-    log_prov = LoggerProvider(resource=resource)
-    log_prov.add_log_record_processor(log_processor)
-    log_handler = LoggingHandler(level=INFO, logger_provider=log_prov)
-    log_handler.setFormatter(Formatter("%(message)s"))
-    logger = getLogger("rg-otel")
-
-    logger.propagate = False
-    logger.addHandler(log_handler)
-    logger.setLevel(INFO)
-    return meter_prov, tracer_prov, logger
+        compression = grpc.Compression.Gzip if settings.gzip else None
+        return GRPCMetricExporter(endpoint=endpoint, insecure=True, timeout=settings.timeout, compression=compression)
+    compression = HTTPCompression.Gzip if settings.gzip else None
+    return HTTPMetricExporter(
+        endpoint=urljoin(endpoint, "/v1/metrics"), timeout=settings.timeout, compression=compression
+    )
+
+
+class SharedMetricExporter(MetricExporter):
+    """Lets several metric readers use one exporter, shutting a reader down leaves the exporter running."""
+
+    def __init__(self, exporter: MetricExporter):
+        super().__init__(
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+        self.exporter = exporter
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        return self.exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        pass
+
+
+@dataclass
+class ExportPipeline:
+    """Exporters and batch processors for one endpoint, shared by all providers sending there.
+
+    Spans and log records carry their provider's resource, so one processor exports them grouped per resource.
+    """
+
+    span_processor: BatchSpanProcessor
+    metric_exporter: MetricExporter
+    log_processor: BatchLogRecordProcessor
+
+    @classmethod
+    def create(cls, settings: OtelSettings) -> "ExportPipeline":
+        endpoint = settings.get_endpoint()
+        if settings.use_grpc:
+            compression = grpc.Compression.Gzip if settings.gzip else None
+            options = {"insecure": True, "timeout": settings.timeout, "compression": compression}
+            span_exporter = GRPCSpanExporter(endpoint=endpoint, **options)
+            log_exporter = GRPCLogExporter(endpoint=endpoint, **options)
+        else:
+            compression = HTTPCompression.Gzip if settings.gzip else None
+            options = {"timeout": settings.timeout, "compression": compression}
+            span_exporter = HTTPSpanExporter(endpoint=urljoin(endpoint, "/v1/traces"), **options)
+            log_exporter = HTTPLogExporter(endpoint=urljoin(endpoint, "/v1/logs"), **options)
+        span_batching = {
+            "max_queue_size": settings.max_queue_size,
+            "max_export_batch_size": settings.max_export_batch_size,
+            "schedule_delay_millis": settings.schedule_delay_millis,
+            "export_timeout_millis": settings.export_timeout_millis,
+        }
+        log_batching = {
+            "max_queue_size": settings.log_max_queue_size,
+            "max_export_batch_size": settings.log_max_export_batch_size,
+            "schedule_delay_millis": settings.log_schedule_delay_millis,
+            "export_timeout_millis": settings.log_export_timeout_millis,
+        }
+        return cls(
+            BatchSpanProcessor(span_exporter, **span_batching),
+            create_metric_exporter(settings),
+            BatchLogRecordProcessor(log_exporter, **log_batching),
+        )
+
+    def shutdown(self):
+        self.span_processor.shutdown()
+        self.log_processor.shutdown()
+        self.metric_exporter.shutdown()
+
+
+class ProviderRegistry:
+    """Providers per resource and export pipelines per endpoint, created once per process."""
+
+    def __init__(self):
+        self.pipelines: dict[tuple, ExportPipeline] = {}
+        self.providers: dict[tuple, tuple[MeterProvider, TracerProvider, Logger]] = {}
+        atexit.register(self.shutdown)
+
+    def get(self, settings: OtelSettings) -> tuple[MeterProvider, TracerProvider, Logger]:
+        resource = Resource(
+            attributes={
+                "service.name": settings.svc_name or "rg-unnamed",
+                "service.namespace": settings.svc_ns or "default",
+                **(settings.extra_attrs or {}),
+            }
+        )
+        pipeline_key = settings.pipeline_key()
+        key = (
+            pipeline_key,
+            settings.metric_export_interval_millis,
+            settings.sampling_key(),
+            tuple(sorted(resource.attributes.items())),
+        )
+        if key in self.providers:
+            return self.providers[key]
+        if pipeline_key not in self.pipelines:
+            self.pipelines[pipeline_key] = ExportPipeline.create(settings)
+        pipeline = self.pipelines[pipeline_key]
+
+        # providers don't shut down on exit themselves, that would shut the shared processors down once per provider
+        tracer_prov = TracerProvider(resource=resource, sampler=create_sampler(settings), shutdown_on_exit=False)
+        tracer_prov.add_span_processor(pipeline.span_processor)
+
+        metric_reader = PeriodicExportingMetricReader(
+            SharedMetricExporter(pipeline.metric_exporter),
+            export_interval_millis=settings.metric_export_interval_millis,
+        )
+        meter_prov = MeterProvider(metric_readers=[metric_reader], resource=resource, shutdown_on_exit=False)
+
+        log_prov = LoggerProvider(resource=resource, shutdown_on_exit=False)
+        log_prov.add_log_record_processor(pipeline.log_processor)
+        log_handler = LoggingHandler(level=INFO, logger_provider=log_prov)
+        log_handler.setFormatter(Formatter("%(message)s"))
+        if settings.log_ratio < 1:
+            # filtered before the handler builds and queues the OTLP record
+            log_handler.addFilter(LogSampler(settings.log_ratio))
+        # one logger per resource, each with exactly one handler
+        logger = getLogger("rg-otel" if not self.providers else f"rg-otel.{len(self.providers)}")
+        logger.propagate = False
+        logger.addHandler(log_handler)
+        logger.setLevel(INFO)
+
+        self.providers[key] = meter_prov, tracer_prov, logger
+        return self.providers[key]
+
+    def shutdown(self):
+        for meter_prov, _, _ in self.providers.values():
+            # collects and exports the last interval through the still running shared exporter
+            meter_prov.shutdown()
+        for pipeline in self.pipelines.values():
+            pipeline.shutdown()
+        self.providers.clear()
+        self.pipelines.clear()
+
+
+registry = ProviderRegistry()
+
+
+def prepare_utils(settings: OtelSettings) -> tuple[MeterProvider, TracerProvider, Logger]:
+    return registry.get(settings)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from logging import Logger, getLogger
+from logging import Logger
 from typing import Awaitable, Callable
 
 from faststream import ContextRepo, Depends
@@ -55,4 +55,4 @@ def meter_fn(meter_provider: MeterProvider = Depends(meter_provider)):
 
 
 def otel_logger(context: ContextRepo) -> Logger:
-    return getLogger("rg-otel")
+    return context.get("otel_logger")
@@ -0,0 +1,48 @@
+import itertools
+from collections.abc import Iterator
+
+import nats
+from nats.aio.client import Client
+
+
+class NatsPool:
+    """Long-lived NATS connections shared by request handlers.
+
+    Connections reconnect on their own and buffer publishes while reconnecting. Publishes are written to the
+    connection's pending buffer and flushed in batches by the client, so handlers don't wait for a round trip.
+    """
+
+    def __init__(self, url: str, size: int = 1, name: str | None = None):
+        self.url = url
+        self.size = size
+        self.name = name
+        self.clients: list[Client] = []
+        self.cycle: Iterator[Client] = iter(())
+
+    async def connect(self):
+        for index in range(self.size):
+            client = await nats.connect(
+                self.url,
+                name=f"{self.name}-{index}" if self.name else None,
+                max_reconnect_attempts=-1,
+                reconnect_time_wait=0.5,
+            )
+            self.clients.append(client)
+        self.cycle = itertools.cycle(self.clients)
+
+    def get(self) -> Client:
+        return next(self.cycle)
+
+    async def close(self):
+        for client in self.clients:
+            # drain flushes pending publishes before closing
+            await client.drain()
+        self.clients = []
+        self.cycle = iter(())
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
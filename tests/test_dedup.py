@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.payloads import synthetic_trace_request
+from otel_demo.exporter.decode import decode_traces
+from otel_demo.exporter.dedup import DedupFilter
+from otel_demo.exporter.ingest import BulkWriter
+from otel_demo.exporter.tables import Base
+
+# Postgres for the tests that write, `username:password@host:5432/dbname` like APP_DB
+TEST_DB = os.getenv("APP_TEST_DB")
+
+
+def repeated_request() -> ExportTraceServiceRequest:
+    # a collector retry merged into the same batch: every span, with its events, arrives twice
+    request = synthetic_trace_request(1, 4, 2)
+    repeated = ExportTraceServiceRequest()
+    repeated.MergeFrom(request)
+    repeated.MergeFrom(request)
+    return repeated
+
+
+def test_repeated_span_drops_its_events():
+    batch, keys = DedupFilter(100).filter(decode_traces(repeated_request()))
+
+    assert batch.count("span") == 4
+    assert batch.count("event") == 8
+    assert len({row[:3] for row in batch["event"]}) == 8
+    assert len(keys) == 4
+
+
+def test_already_accepted_span_drops_its_events():
+    dedup = DedupFilter(100)
+    rows = decode_traces(synthetic_trace_request(1, 4, 2))
+    dedup.remember(dedup.filter(rows)[1])
+
+    batch, keys = dedup.filter(rows)
+
+    assert batch.count("span") == 0
+    assert batch.count("event") == 0
+    assert keys == []
+
+
+@pytest.mark.skipif(not TEST_DB, reason="APP_TEST_DB is not set")
+def test_repeated_span_writes_without_ignore_conflicts():
+    async def run():
+        engine = create_async_engine("postgresql+psycopg://" + TEST_DB)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        batch, _ = DedupFilter(100).filter(decode_traces(repeated_request()))
+        trace_ids = list({row[0] for row in batch["span"]})
+        try:
+            await BulkWriter(engine, ignore_conflicts=False).write(batch)
+            async with engine.connect() as conn:
+                stored = await conn.execute(
+                    text("SELECT count(*) FROM event WHERE trace_id = ANY(:trace_ids)"), {"trace_ids": trace_ids}
+                )
+                assert stored.scalar() == 8
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text("DELETE FROM span WHERE trace_id = ANY(:trace_ids)"), {"trace_ids": trace_ids})
+            await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,44 @@
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+
+from otel_demo.utils import base
+from otel_demo.utils.base import RateLimitingSampler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def sampled(sampler: RateLimitingSampler) -> bool:
+    return sampler.should_sample(None, 1, "span").decision.is_sampled()
+
+
+def test_rate_limit_below_one_per_second(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(base.time, "monotonic", clock)
+    sampler = RateLimitingSampler(0.5, ALWAYS_ON)
+
+    assert sampled(sampler)
+    assert not sampled(sampler)
+    clock.now += 1.0
+    assert not sampled(sampler)
+    clock.now += 1.0
+    assert sampled(sampler)
+    # idle time doesn't accumulate more than one token
+    clock.now += 10.0
+    assert sampled(sampler)
+    assert not sampled(sampler)
+
+
+def test_rate_limit_bursts_up_to_one_second(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(base.time, "monotonic", clock)
+    sampler = RateLimitingSampler(5, ALWAYS_ON)
+
+    assert [sampled(sampler) for _ in range(6)] == [True] * 5 + [False]
+    clock.now += 0.2
+    assert sampled(sampler)
+    assert not sampled(sampler)